@@ -0,0 +1,62 @@
+# Mesures du cube et leur fonction de cumul (une somme de sommes reste une somme)
+MEASURES = {'Montant': 'sum', 'Nombre': 'sum', 'Min': 'min', 'Max': 'max'}
+
+# Regroupement le plus fin partagé par les vues du tableau de bord
+BASE_KEYS = ('CATEGORIE', 'Desc_Cat', 'Desc_CA')
+
+
+# Moteur d'agrégation partagé pour un état de filtres : un seul passage sur les données
+# filtrées calcule le regroupement de base, tous les autres regroupements en sont
+# dérivés et mémorisés. `scans` compte les passages sur les données.
+class Aggregator:
+    def __init__(self, data, base_keys=BASE_KEYS):
+        self.data = data
+        self.base_keys = tuple(base_keys)
+        self.scans = 0
+        self._groups = {}
+
+    def _measures(self, frame):
+        return {col: func for col, func in MEASURES.items() if col in frame.columns}
+
+    def _group(self, frame, keys):
+        if not keys:
+            return frame.agg(self._measures(frame)).to_frame().T
+        return frame.groupby(list(keys), observed=True).agg(self._measures(frame)).reset_index()
+
+    def _scan(self, keys, where):
+        self.scans += 1
+        data = self.data
+        for col, value in where.items():
+            data = data[data[col] == value]
+        return self._group(data, keys)
+
+    # Regroupement par `keys`, restreint aux lignes où chaque colonne de `where` vaut la valeur donnée
+    def by(self, *keys, **where):
+        wanted = set(keys) | set(where)
+        if not wanted <= set(self.base_keys):
+            return self._scan(keys, where)
+        key = (tuple(keys), tuple(sorted(where.items())))
+        if key not in self._groups:
+            if key == (self.base_keys, ()):
+                self._groups[key] = self._scan(self.base_keys, {})
+            else:
+                base = self.by(*self.base_keys)
+                for col, value in where.items():
+                    base = base[base[col] == value]
+                self._groups[key] = self._group(base, keys)
+        return self._groups[key]
+
+    def total(self):
+        return self.by().iloc[0]
+
+    # Tableau croisé des sommes de Montant avec marges 'Total', comme pd.pivot_table(margins=True)
+    def pivot(self, index, columns, margins_name='Total', **where):
+        # Clés en object : un pivot sur Categorical ferait réapparaître les modalités absentes
+        cells = self.by(index, columns, **where).astype({index: object, columns: object})
+        table = cells.pivot(index=index, columns=columns, values='Montant').fillna(0)
+        table[margins_name] = table.sum(axis=1)
+        table.loc[margins_name] = table.sum(axis=0)
+        return table
+
+    def empty(self):
+        return self.by(*self.base_keys).empty
@@ -0,0 +1,281 @@
+import os
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from data_model import AMOUNT_SCALE
+from sql_store import SQL_FILE, connection
+
+# Dépenses inhabituelles par équipement (d'un site) et type de consommation, sur toute la flotte.
+# Le cube journalier est cumulé par semaine (au jour près, les dépenses d'un équipement
+# sont trop clairsemées pour un score) et chaque semaine dépensée est comparée :
+#  - à l'historique de l'équipement : z robuste (médiane, MAD) des semaines dépensées parmi
+#    les WINDOW précédentes, s'il y en a au moins MIN_HISTORY ;
+#  - à ses pairs (même CATEGORIE, même type, tous sites) : z robuste face aux dépenses hebdomadaires des
+#    équipements du groupe sur les PEER_WEEKS dernières semaines, s'il y en a au moins MIN_PEERS ;
+#  - au plus fort montant des WINDOW semaines précédentes : saut brutal au-delà de JUMP_RATIO fois.
+# Les semaines sans dépense sont ignorées : sinon médiane et MAD seraient nulles et toute
+# dépense ponctuelle paraîtrait anormale. Seuls les dépassements sont signalés.
+WINDOW = 26
+MIN_HISTORY = 6
+PEER_WEEKS = 13
+MIN_PEERS = 3
+Z_THRESHOLD = 3.5
+JUMP_RATIO = 3.0
+
+# MAD -> écart-type d'une loi normale ; écart absolu moyen -> écart-type, en repli quand la
+# MAD est nulle (montants hebdomadaires souvent identiques)
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+
+# Semaines signalées affichées au plus dans l'onglet Recommandations
+MAX_FLAGS_SHOWN = 100
+
+# Semaines dépensées évaluées par lot : borne la mémoire des fenêtres copiées (lot x WINDOW)
+BATCH_CELLS = 65536
+
+KEYS = ['Site', 'CATEGORIE', 'Desc_Cat', 'Desc_CA']
+REASONS = ('historique', 'pairs', 'saut')
+# Lundi de référence pour numéroter les semaines
+EPOCH = pd.Timestamp('2000-01-03')
+
+_detectors = {}
+_lock = threading.Lock()
+
+
+def week_number(dates):
+    return np.asarray((pd.DatetimeIndex(pd.to_datetime(dates)) - EPOCH).days // 7)
+
+
+# Lundi de chaque numéro de semaine
+def week_start(weeks):
+    return EPOCH + pd.to_timedelta(np.asarray(weeks) * 7, unit='D')
+
+
+# Médiane des `counts` valeurs qui suivent `offset` dans des tableaux triés le long du
+# dernier axe (NaN en fin)
+def _sorted_median(values, counts, offset=0):
+    lo = np.take_along_axis(values, (offset + np.maximum(counts - 1, 0) // 2)[..., None], axis=-1)[..., 0]
+    hi = np.take_along_axis(values, (offset + counts // 2)[..., None], axis=-1)[..., 0]
+    return np.where(counts > 0, (lo + hi) / 2, np.nan)
+
+
+# Centre (médiane) et dispersion robuste le long du dernier axe, sans les valeurs nulles ;
+# NaN quand il reste moins de `min_count` valeurs ou que la dispersion est nulle.
+# Les dépenses sont très asymétriques (quelques grosses réparations) : la dispersion est la
+# MAD de la moitié haute (« double MAD »), qui ne sert qu'à juger les dépassements.
+# Un seul tri vectorisé (les NaN passent en fin) plutôt que np.nanmedian, bien plus lent.
+def robust_center(values, min_count):
+    values = np.where(values != 0, values, np.nan)
+    counts = np.count_nonzero(~np.isnan(values), axis=-1)
+    ordered = np.sort(values, axis=-1)
+    center = _sorted_median(ordered, counts)
+    # Moitié haute : valeurs triées à partir de l'indice counts // 2, écarts déjà croissants
+    upper = counts - counts // 2
+    scale = MAD_SCALE * (_sorted_median(ordered, upper, counts // 2) - center)
+    above = np.where(values >= center[..., None], values - center[..., None], 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(scale > 0, scale, MEAN_AD_SCALE * above.sum(axis=-1) / upper)
+    valid = counts >= min_count
+    return np.where(valid, center, np.nan), np.where(valid & (scale > 0), scale, np.nan)
+
+
+# Scores contre l'historique propre pour les semaines `start` et suivantes : z robuste et
+# rapport au plus fort montant des WINDOW semaines précédentes. Seules les semaines
+# dépensées sont évaluées, leurs fenêtres étant rassemblées par lots.
+def history_scores(values, start=0):
+    n, m = values.shape
+    z = np.full((n, m - start), np.nan)
+    jump = np.full((n, m - start), np.nan)
+    first = max(start, WINDOW)
+    if first >= m:
+        return z, jump
+    # windows[:, j] = semaines j à j + WINDOW - 1 ; la semaine t est comparée à windows[:, t - WINDOW]
+    windows = sliding_window_view(values, WINDOW, axis=1)
+    rows, weeks = np.nonzero(values[:, first:])
+    weeks += first
+    for i in range(0, len(rows), BATCH_CELLS):
+        r, t = rows[i:i + BATCH_CELLS], weeks[i:i + BATCH_CELLS]
+        history = windows[r, t - WINDOW]
+        center, scale = robust_center(history, MIN_HISTORY)
+        peak = np.where(np.isnan(center), np.nan, history.max(axis=-1))
+        z[r, t - start] = (values[r, t] - center) / scale
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jump[r, t - start] = np.where(peak > 0, values[r, t] / peak, np.nan)
+    return z, jump
+
+
+# z robuste de chaque semaine dépensée (à partir de `start`) face aux dépenses hebdomadaires du
+# groupe (CATEGORIE, type) sur les PEER_WEEKS semaines qui se terminent par elle ; un groupe
+# à la fois. Les semaines sans dépense étant ignorées, une série ajoutée (nulle avant ses
+# premières données) ne change pas les scores des semaines antérieures.
+def peer_scores(values, groups, start=0):
+    n, m = values.shape
+    z = np.full((n, m - start), np.nan)
+    padded = np.pad(values, ((0, 0), (PEER_WEEKS - 1, 0)))
+    order = np.argsort(groups, kind='stable')
+    for rows in np.split(order, np.flatnonzero(np.diff(groups[order])) + 1):
+        # pooled[t] : dépenses du groupe sur les semaines t - PEER_WEEKS + 1 à t
+        windows = sliding_window_view(padded[rows], PEER_WEEKS, axis=1)[:, start:]
+        pooled = windows.transpose(1, 0, 2).reshape(m - start, -1)
+        center, scale = robust_center(pooled, MIN_PEERS)
+        current = values[rows, start:]
+        z[rows] = np.where(current != 0, current - center, np.nan) / scale
+    return z
+
+
+# Séries hebdomadaires et scores de la flotte à un instant donné. Jamais modifié sur place :
+# refresh en construit un nouveau et le remplace d'une seule affectation, si bien que flagged
+# lit toujours un état cohérent sans attendre le verrou pendant un recalcul.
+@dataclass(frozen=True)
+class WeeklyScores:
+    index: pd.MultiIndex
+    first_week: int
+    values: np.ndarray
+    z_history: np.ndarray
+    jump: np.ndarray
+    z_peers: np.ndarray
+
+
+def _empty_scores():
+    empty = np.zeros((0, 0))
+    return WeeklyScores(pd.MultiIndex.from_arrays([[]] * len(KEYS), names=KEYS), 0, empty, empty, empty, empty)
+
+
+# Scores d'avant la mise à jour, complétés par des NaN jusqu'à `rows` séries (nouvelles séries)
+def _pad(scores, rows):
+    missing = rows - scores.shape[0]
+    return np.vstack([scores, np.full((missing, scores.shape[1]), np.nan)]) if missing else scores
+
+
+# Scores de toute la flotte, gardés en mémoire et mis à jour quand des parties arrivent dans la
+# base SQLite : seules les semaines à partir de la plus ancienne date ajoutée sont recalculées.
+class AnomalyDetector:
+    def __init__(self, path=SQL_FILE):
+        self.path = path
+        self.parts = frozenset()
+        self._lock = threading.Lock()
+        self.scores = _empty_scores()
+
+    # Prendre en compte les parties synchronisées depuis le dernier appel.
+    # Retourne le nombre de semaines recalculées (0 si rien n'a changé).
+    def refresh(self):
+        with self._lock:
+            with connection(self.path) as conn:
+                # Lecture cohérente des parties et du cube (instantané WAL)
+                conn.execute('BEGIN')
+                parts = frozenset(row[0] for row in conn.execute('SELECT file FROM parts'))
+                if parts == self.parts:
+                    conn.execute('COMMIT')
+                    return 0
+                # Parties seulement ajoutées : reprise à la semaine de leur plus ancienne date ;
+                # parties retirées ou remplacées, ou données plus anciennes que tout : reprise complète
+                since = None
+                if self.parts and self.parts <= parts and self.scores.values.size:
+                    added = sorted(parts - self.parts)
+                    first_day = conn.execute(
+                        f"SELECT MIN(Date) FROM cube WHERE part IN ({', '.join('?' * len(added))})", added
+                    ).fetchone()[0]
+                    if first_day is None:
+                        # Parties vides : rien à recalculer
+                        conn.execute('COMMIT')
+                        self.parts = parts
+                        return 0
+                    since = int(week_number([first_day])[0])
+                    since = since if since >= self.scores.first_week else None
+                where, params = ('', []) if since is None else (' WHERE Date >= ?', [str(week_start(since).date())])
+                cells = pd.read_sql_query(
+                    f"SELECT {', '.join(KEYS)}, Date, Montant FROM cube{where}", conn, params=params
+                )
+                conn.execute('COMMIT')
+            recomputed = self._update(cells, since)
+            self.parts = parts
+            return recomputed
+
+    def _update(self, cells, since):
+        old = self.scores
+        weekly = cells.assign(Semaine=week_number(cells['Date'])).groupby(KEYS + ['Semaine'])['Montant'].sum()
+        pairs = weekly.index.droplevel('Semaine')
+        weeks = weekly.index.get_level_values('Semaine').to_numpy()
+        if since is None:
+            if weekly.empty:
+                self.scores = _empty_scores()
+                return 0
+            index = pairs.unique()
+            first_week = int(weeks.min())
+            values = np.zeros((len(index), int(weeks.max()) - first_week + 1))
+            start = 0
+        else:
+            index = old.index.append(pairs.unique().difference(old.index))
+            first_week = old.first_week
+            last_week = max(int(weeks.max()) if len(weeks) else 0, first_week + old.values.shape[1] - 1)
+            # Après un trou (semaines sans partie), reprise à la fin de l'ancienne fenêtre :
+            # les semaines vides sont recalculées avec les nouvelles
+            start = min(since - first_week, old.values.shape[1])
+            values = np.zeros((len(index), last_week - first_week + 1))
+            values[:old.values.shape[0], :start] = old.values[:, :start]
+        values[index.get_indexer(pairs), weeks - first_week] = weekly.to_numpy(dtype='float64')
+
+        groups = pd.MultiIndex.from_arrays(
+            [index.get_level_values('CATEGORIE'), index.get_level_values('Desc_Cat')]
+        ).factorize()[0]
+        z, jump = history_scores(values, start)
+        z_peers = peer_scores(values, groups, start)
+        if start:
+            z = np.hstack([_pad(old.z_history[:, :start], len(index)), z])
+            jump = np.hstack([_pad(old.jump[:, :start], len(index)), jump])
+            z_peers = np.hstack([_pad(old.z_peers[:, :start], len(index)), z_peers])
+        self.scores = WeeklyScores(index, first_week, values, z, jump, z_peers)
+        return values.shape[1] - start
+
+    # Semaines signalées qui chevauchent [start, end], pour un équipement ou toute la flotte,
+    # sur les sites `sites` (tous sinon) : une ligne par (site, équipement, type, semaine), les
+    # plus récentes puis les plus coûteuses d'abord
+    def flagged(self, start=None, end=None, equipment=None, sites=None):
+        columns = KEYS + ['Semaine', 'Montant', 'Écart historique (z)', 'Écart aux pairs (z)', 'Saut (×)', 'Motif']
+        # Un seul instantané pour toute la lecture, même si refresh le remplace entre-temps
+        scores = self.scores
+        if not scores.values.size:
+            return pd.DataFrame(columns=columns)
+        first = 0 if start is None else max(int(week_number([start])[0]) - scores.first_week, 0)
+        last = scores.values.shape[1] if end is None else max(int(week_number([end])[0]) - scores.first_week + 1, 0)
+        rows = slice(None)
+        if equipment is not None or sites is not None:
+            keep = np.ones(len(scores.index), dtype=bool)
+            if equipment is not None:
+                keep &= scores.index.get_level_values('Desc_CA') == equipment
+            if sites is not None:
+                keep &= scores.index.get_level_values('Site').isin(sites)
+            rows = np.flatnonzero(keep)
+        z_history = scores.z_history[rows, first:last]
+        z_peers = scores.z_peers[rows, first:last]
+        jump = scores.jump[rows, first:last]
+        reasons = np.stack([z_history >= Z_THRESHOLD, z_peers >= Z_THRESHOLD, jump >= JUMP_RATIO])
+        found, weeks = np.nonzero(reasons.any(axis=0))
+        series = found if isinstance(rows, slice) else rows[found]
+        # Motif : libellé des règles franchies, via le masque binaire des trois règles
+        codes = (reasons[:, found, weeks] * np.array([[1], [2], [4]])).sum(axis=0)
+        labels = np.array([', '.join(name for bit, name in zip((1, 2, 4), REASONS) if code & bit) for code in range(8)])
+        frame = scores.index[series].to_frame(index=False).assign(
+            Semaine=week_start(scores.first_week + first + weeks),
+            Montant=scores.values[series, first + weeks] / AMOUNT_SCALE,
+            **{
+                'Écart historique (z)': z_history[found, weeks].round(1),
+                'Écart aux pairs (z)': z_peers[found, weeks].round(1),
+                'Saut (×)': jump[found, weeks].round(1),
+                'Motif': labels[codes],
+            }
+        )
+        return frame[columns].sort_values(['Semaine', 'Montant'], ascending=False, ignore_index=True)
+
+
+# Détecteur unique par base, partagé par les sessions et le préchauffage du processus
+def get_detector(path=SQL_FILE):
+    path = os.path.abspath(path)
+    with _lock:
+        if path not in _detectors:
+            _detectors[path] = AnomalyDetector(path)
+        return _detectors[path]
@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from anomalies import AnomalyDetector
+from cleaning import CONSUMPTION_COLUMNS, ENGINS_COLUMNS, clean_consumption, clean_engins
+from data_store import ingest_workbooks, store_parts
+from search_index import EquipmentIndex
+from shared_cache import SharedCache, dataset_fingerprint
+from sql_store import GRAINS, SqlAggregator, connection, date_bounds, distinct_values, fetch_rows, sync_sql_store
+from synthetic_data import parse_size, write_dataset
+from workbooks import WorkbookSpec, read_workbook
+
+# Banc d'essai des chemins critiques des deux tableaux de bord sur données synthétiques :
+#   python bench.py --sizes 10k 100k --out bench.json
+#   python bench.py --sizes 10k 100k --compare bench_avant.json
+# Les jeux de données sont générés une fois dans bench_data/<taille>/ puis réutilisés.
+
+DATA_DIR = 'bench_data'
+
+# Une mesure est une régression si sa médiane dépasse la référence de ce facteur...
+THRESHOLD = 1.25
+# ...et d'au moins cette durée (les mesures de quelques millisecondes sont bruitées)
+NOISE_FLOOR = 0.005
+
+
+class Recorder:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+
+    def _store(self, name, times):
+        self.results[name] = {
+            'median': statistics.median(times),
+            'min': min(times),
+            'runs': len(times),
+        }
+
+    # Mesurer `func` `repeat` fois (une seule pour les opérations à froid) et rendre son dernier résultat
+    def time(self, name, func, repeat=None):
+        times = []
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+        self._store(name, times)
+        return result
+
+    # Mesurer chaque étape d'une séquence dépendante (l'état est recréé à chaque répétition)
+    def time_steps(self, prefix, setup, steps):
+        times = {name: [] for name, _ in steps}
+        for _ in range(self.repeat):
+            state = setup()
+            for name, step in steps:
+                start = time.perf_counter()
+                step(state)
+                times[name].append(time.perf_counter() - start)
+        for name, values in times.items():
+            self._store(f"{prefix}.{name}", values)
+
+
+# Les appels de main_app pour un état de filtres, dans l'ordre du premier affichage
+def _main_app_steps(cats, equipment):
+    steps = [
+        ('empty', lambda agg: agg.empty()),
+        ('total', lambda agg: agg.total()),
+        ('by_categorie', lambda agg: agg.by('CATEGORIE')),
+        ('by_categorie_type', lambda agg: agg.by('CATEGORIE', 'Desc_Cat')),
+        ('pivot_categorie_type', lambda agg: agg.pivot('CATEGORIE', 'Desc_Cat')),
+        ('pivot_engine', lambda agg: agg.pivot('Desc_CA', 'Desc_Cat', CATEGORIE=cats[0])),
+        ('category_tabs', lambda agg: [agg.by('Desc_CA', CATEGORIE=cat) for cat in cats]),
+        ('equipment_types', lambda agg: agg.by('Desc_Cat', CATEGORIE=cats[0], Desc_CA=equipment)),
+        ('equipment_timeline', lambda agg: agg.by('Date', CATEGORIE=cats[0], Desc_CA=equipment)),
+        ('table_types', lambda agg: agg.by('Desc_Cat')),
+        ('table_count', lambda agg: agg.row_count(Desc_Cat=None)),
+    ]
+    return steps
+
+
+def bench_consumption(rec, directory, workbooks):
+    store_dir = os.path.join(directory, 'engins2.store')
+    sql_file = os.path.join(directory, 'engins2.sqlite')
+    cache_file = os.path.join(directory, 'engins2.cache.sqlite')
+    shutil.rmtree(store_dir, ignore_errors=True)
+    for path in (sql_file, cache_file):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    # Chargement : lecture + nettoyage, ingestion à froid (classeurs lus en parallèle) et à chaud, copie SQLite
+    rec.time('load.read_clean', lambda: read_workbook(WorkbookSpec(workbooks[0]), clean_consumption, CONSUMPTION_COLUMNS), repeat=1)
+    rec.time('load.ingest', lambda: ingest_workbooks(store_dir, workbooks, clean_consumption, columns=CONSUMPTION_COLUMNS), repeat=1)
+    rec.time('load.ingest_unchanged', lambda: ingest_workbooks(store_dir, workbooks, clean_consumption, columns=CONSUMPTION_COLUMNS))
+    parts = store_parts(store_dir)
+    rec.time('load.sync_sql', lambda: sync_sql_store(store_dir, parts, sql_file), repeat=1)
+
+    # Barre latérale
+    def bounds():
+        with connection(sql_file) as conn:
+            return date_bounds(conn)
+
+    def names():
+        with connection(sql_file) as conn:
+            return distinct_values(conn, 'Desc_CA')
+
+    first_day, last_day = rec.time('sidebar.date_bounds', bounds)
+    equipment_names = names()
+    index = rec.time('sidebar.equipment_index', lambda: EquipmentIndex(equipment_names))
+    rec.time('sidebar.search', lambda: index.search('n°1'))
+    rec.time('sidebar.suggest', lambda: index.suggest('chargeuze'))
+
+    # Agrégations de main_app pour trois états de filtres, sans cache (coût SQL réel)
+    base = SqlAggregator(sql_file, start=first_day, end=last_day)
+    top = base.by('CATEGORIE', 'Desc_CA').nlargest(1, 'Montant').iloc[0]
+    cats = sorted(base.by('CATEGORIE')['CATEGORIE'])
+    cats = [top['CATEGORIE']] + [cat for cat in cats if cat != top['CATEGORIE']]
+    quarter_start = last_day - pd.DateOffset(months=3)
+    states = {
+        'all': dict(start=first_day, end=last_day, Desc_CA=None),
+        'equipment': dict(start=first_day, end=last_day, Desc_CA=top['Desc_CA']),
+        'quarter': dict(start=quarter_start, end=last_day, Desc_CA=None),
+    }
+    for name, filters in states.items():
+        rec.time_steps(
+            f"main_app.{name}",
+            lambda filters=filters: SqlAggregator(sql_file, **filters),
+            _main_app_steps(cats, top['Desc_CA'])
+        )
+
+    # Tableau détaillé : première page, et dernière page triée par montant décroissant
+    def page(order_by, descending, offset):
+        with connection(sql_file) as conn:
+            return fetch_rows(
+                conn, ['Date', 'Desc_CA', 'Desc_Cat', 'Montant'], order_by, descending, 100, offset,
+                start=first_day, end=last_day
+            )
+    n_rows = base.row_count()
+    rec.time('table.first_page', lambda: page('Date', False, 0))
+    rec.time('table.last_page_by_amount', lambda: page('Montant', True, max(0, n_rows - 100)))
+
+    # Séries temporelles sur toute la période : cube journalier puis tables de cumuls
+    for grain in GRAINS:
+        rec.time(f"rollup.{grain}", lambda grain=grain: SqlAggregator(sql_file, **states['all']).timeline(grain, 'CATEGORIE'))
+
+    # Anomalies : calcul complet sur la flotte, vérification sans nouvelle donnée, semaines signalées
+    rec.time('anomalies.full', lambda: AnomalyDetector(sql_file).refresh(), repeat=1)
+    detector = AnomalyDetector(sql_file)
+    detector.refresh()
+    rec.time('anomalies.refresh_unchanged', detector.refresh)
+    rec.time('anomalies.flagged', lambda: detector.flagged(first_day, last_day))
+
+    # Cache partagé : premier calcul puis lecture par un autre "réplica"
+    cache = SharedCache(cache_file, dataset_fingerprint(parts))
+    rec.time('shared_cache.miss', lambda: SqlAggregator(sql_file, cache=cache, **states['all']).by('CATEGORIE'), repeat=1)
+    rec.time('shared_cache.hit', lambda: SqlAggregator(sql_file, cache=cache, **states['all']).by('CATEGORIE'))
+
+
+# Chemins de engins_test.main : chargement, filtres, agrégats et détail par engin
+def bench_engins_test(rec, directory):
+    df, _ = rec.time('engins_test.load', lambda: read_workbook(WorkbookSpec(os.path.join(directory, 'engins.xlsx')), clean_engins, ENGINS_COLUMNS), repeat=1)
+    equipments = sorted(df['Engin'].unique())
+    months = sorted(df['MOIS'].unique())
+    categories = sorted(df['Desc_Cat'].unique())
+
+    def filters():
+        return df[
+            (df['Engin'].isin(equipments)) &
+            (df['MOIS'].isin(months)) &
+            (df['Desc_Cat'].isin(categories))
+        ]
+    filtered_df = rec.time('engins_test.filters', filters)
+
+    def summary():
+        filtered_df.groupby('Engin', observed=True)['Montant'].sum().mean()
+        filtered_df.groupby('Desc_Cat', observed=True)['Montant'].sum().idxmax()
+        df[df['Desc_Cat'] == 'PNEUMATIQUES'].groupby('Engin', observed=True)['Montant'].sum()
+        filtered_df.groupby(['YearMonth', 'Engin'], observed=True)['Montant'].sum()
+        filtered_df.groupby(['Engin', 'Desc_Cat'], observed=True)['Montant'].sum()
+    rec.time('engins_test.summary', summary)
+
+    # Détail par engin : une agrégation Engin × Desc_Cat, une page d'engins, un engin détaillé
+    def per_equipment():
+        costs = filtered_df.groupby(['Engin', 'Desc_Cat'], observed=True)['Montant'].sum().reset_index()
+        costs[costs['Engin'].isin(equipments[:12])]
+        filtered_df.loc[filtered_df['Engin'] == equipments[0], ['Date', 'MOIS', 'Desc_Cat', 'Montant']]
+    rec.time('engins_test.per_equipment', per_equipment)
+
+
+def _meta():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+# Comparer deux rapports ; retourne les mesures en régression
+def compare(baseline, current, threshold=THRESHOLD):
+    regressions = []
+    for size, results in current['results'].items():
+        for name, result in results.items():
+            before = baseline['results'].get(size, {}).get(name)
+            if before is None:
+                continue
+            ratio = result['median'] / before['median'] if before['median'] else float('inf')
+            flag = ''
+            if ratio > threshold and result['median'] - before['median'] > NOISE_FLOOR:
+                regressions.append((size, name, ratio))
+                flag = '  <-- régression'
+            print(f"{size:>6} {name:<42} {before['median']:9.4f} s -> {result['median']:9.4f} s  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai sur données synthétiques")
+    parser.add_argument('--sizes', nargs='+', default=['10k', '100k'], help="Tailles : 10k 100k 1M 10M")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help="Fichier JSON des résultats (sortie standard sinon)")
+    parser.add_argument('--compare', help="Rapport JSON de référence (ex. celui du commit précédent)")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    args = parser.parse_args()
+
+    report = {'meta': _meta(), 'results': {}}
+    for size in args.sizes:
+        directory = os.path.join(args.data_dir, size)
+        workbooks = write_dataset(directory, parse_size(size))
+        rec = Recorder(args.repeat)
+        bench_consumption(rec, directory, workbooks)
+        bench_engins_test(rec, directory)
+        report['results'][size] = rec.results
+        print(f"{size} : {len(rec.results)} mesures", file=sys.stderr)
+
+    output = json.dumps(report, indent=1)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(output)
+    elif not args.compare:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# Bornes du volume envoyé au navigateur par figure : au-delà de TOP_N barres la
+# queue est regroupée dans « Autres », au-delà de MAX_POINTS points une série
+# temporelle est sous-échantillonnée
+TOP_N = 25
+MAX_POINTS = 1000
+OTHERS = 'Autres'
+
+
+# Garder les `n` libellés de plus forte valeur et cumuler les autres dans une barre
+# « Autres (k) ». Avec `keys` (ex. ['YearMonth']), le classement se fait sur le total
+# par libellé et le cumul reste ventilé par clé, pour une courbe « Autres » par exemple.
+# Retourne la frame et l'ordre des libellés (les plus forts d'abord, « Autres » en dernier).
+def fold_top_n(frame, label, value, n=TOP_N, keys=()):
+    keys = list(keys)
+    totals = frame.groupby(label, observed=True)[value].sum().sort_values(ascending=False)
+    if len(totals) <= n:
+        return frame, list(totals.index)
+    top = list(totals.index[:n])
+    others = f"{OTHERS} ({len(totals) - n})"
+    frame = frame.astype({label: object})
+    kept = frame[frame[label].isin(top)]
+    rest = frame[~frame[label].isin(top)]
+    if keys:
+        rest = rest.groupby(keys, observed=True, as_index=False)[value].sum()
+    else:
+        rest = pd.DataFrame({value: [rest[value].sum()]})
+    rest[label] = others
+    return pd.concat([kept, rest[kept.columns.intersection(rest.columns)]], ignore_index=True), top + [others]
+
+
+# Indices retenus par Largest-Triangle-Three-Buckets : premier et dernier point, puis
+# dans chaque seau le point qui forme le plus grand triangle avec le point retenu
+# précédent et la moyenne du seau suivant. Le maximum et le minimum globaux sont
+# toujours conservés pour ne perdre aucun pic.
+def lttb_indices(x, y, max_points):
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    edges = np.floor(np.arange(max_points - 1) * (n - 2) / (max_points - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    selected = [0]
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) -
+            (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected.append(a)
+    selected.append(n - 1)
+    selected.extend([int(y.argmax()), int(y.argmin())])
+    return np.unique(selected)
+
+
+# Sous-échantillonner une série (ou une série par valeur de `by`) triée sur `x`.
+# Les dates passent en nanosecondes pour le calcul des aires.
+def downsample(frame, x, y, max_points=MAX_POINTS, by=None):
+    if by is not None:
+        if frame.empty or frame.groupby(by, observed=True).size().max() <= max_points:
+            return frame
+        return pd.concat(
+            [downsample(group, x, y, max_points) for _, group in frame.groupby(by, observed=True)],
+            ignore_index=True
+        )
+    if len(frame) <= max_points:
+        return frame
+    frame = frame.sort_values(x)
+    xs = frame[x]
+    if pd.api.types.is_datetime64_any_dtype(xs):
+        xs = xs.astype('int64').to_numpy()
+    elif pd.api.types.is_numeric_dtype(xs):
+        xs = xs.to_numpy()
+    else:
+        # Libellés ordonnés (ex. 'YYYY-MM') : points régulièrement espacés
+        xs = np.arange(len(frame))
+    return frame.iloc[lttb_indices(xs, frame[y].to_numpy(), max_points)]
+
+
+# Restreindre une série à la plage [x0, x1] d'une sélection rectangulaire Plotly
+def zoom_window(frame, x, x_range):
+    if pd.api.types.is_datetime64_any_dtype(frame[x]):
+        x_range = [pd.Timestamp(value) for value in x_range]
+    x0, x1 = sorted(x_range)
+    return frame[(frame[x] >= x0) & (frame[x] <= x1)]
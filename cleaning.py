@@ -0,0 +1,130 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from data_model import compact
+from quality import QualityReport, check_rules
+
+# Correspondance des mois anglais -> français
+months_fr = {
+    'January': 'Janvier', 'February': 'Février', 'March': 'Mars',
+    'April': 'Avril', 'May': 'Mai', 'June': 'Juin',
+    'July': 'Juillet', 'August': 'Août', 'September': 'Septembre',
+    'October': 'Octobre', 'November': 'Novembre', 'December': 'Décembre'
+}
+month_order = list(months_fr.values())
+
+# Mois en majuscules de engins.xlsx (colonne MOIS), indexés par numéro de mois
+MOIS_UPPER = [month.upper() for month in month_order]
+month_mapping = {month: month for month in MOIS_UPPER}
+
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+# Numéros de série convertibles en datetime64[ns] (1677 à 2192) ; au-delà la date est invalide
+MIN_SERIAL = (pd.Timestamp.min - EXCEL_EPOCH).days + 1
+MAX_SERIAL = pd.Timedelta.max.days - 1
+EQUIPMENT_NUMBER = re.compile(r'N[°ｰ](\d+)', re.IGNORECASE)
+
+# Colonnes lues dans chaque classeur : les autres ne sont jamais chargées
+CONSUMPTION_COLUMNS = ['Date', 'CATEGORIE', 'Desc_Cat', 'Desc_CA', 'Montant']
+ENGINS_COLUMNS = ['Date', 'MOIS', 'Desc_CA', 'Desc_Cat', 'Montant']
+
+
+# Appliquer une transformation vectorisée aux seules valeurs distinctes, puis
+# la redistribuer sur les lignes : le coût dépend de la cardinalité, pas du nombre de lignes
+def map_distinct(series, func):
+    codes, uniques = pd.factorize(series)
+    if not len(uniques):
+        return pd.Series(np.nan, index=series.index, dtype=object)
+    mapped = func(pd.Series(uniques, dtype=object)).to_numpy()
+    values = mapped.take(codes)
+    # Les valeurs manquantes (code -1) restent manquantes
+    result = pd.Series(values, index=series.index)
+    result[codes < 0] = np.nan
+    return result
+
+
+# Conversion vectorisée des dates : les numéros de série Excel (nombres ou texte numérique)
+# sont convertis en bloc, les dates texte sont analysées une fois par valeur distincte
+def excel_dates_to_datetime(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    serials = pd.to_numeric(values, errors='coerce')
+    is_serial = serials.between(MIN_SERIAL, MAX_SERIAL)
+    dates = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    dates[is_serial] = (EXCEL_EPOCH + pd.to_timedelta(serials[is_serial], unit='D')).dt.round('us')
+    text = values[serials.isna() & values.notna()]
+    if not text.empty:
+        dates[text.index] = map_distinct(
+            text, lambda uniques: pd.to_datetime(uniques, format='mixed', errors='coerce')
+        ).astype('datetime64[ns]')
+    return dates
+
+
+# Numéro d'engin (N°12, Nｰ12...) extrait une fois par libellé distinct
+def extract_equipment_numbers(desc):
+    numbers = map_distinct(desc, lambda uniques: uniques.str.extract(EQUIPMENT_NUMBER, expand=False))
+    return pd.to_numeric(numbers, errors='coerce')
+
+
+def _squeeze_spaces(labels):
+    return labels.str.strip().str.replace(r'\s+', ' ', regex=True)
+
+
+# Nettoyer un libellé d'équipement : espaces multiples et coquilles connues
+def _clean_equipment_labels(labels):
+    return _squeeze_spaces(labels).str.replace('CATERPILLARD', 'CATERPILLAR').str.replace('Nｰ', 'N°')
+
+
+# Nettoyage du classeur de consommation (engins2.xlsx)
+def clean_consumption(df):
+    df['Date'] = excel_dates_to_datetime(df['Date'])
+    df = df.dropna(subset=['CATEGORIE', 'Desc_Cat', 'Desc_CA', 'Montant'])
+    df['Montant'] = pd.to_numeric(df['Montant'], errors='coerce')
+    # Clean text columns (une fois par libellé distinct)
+    df['Desc_Cat'] = map_distinct(df['Desc_Cat'], _squeeze_spaces)
+    df['Desc_CA'] = map_distinct(df['Desc_CA'], _clean_equipment_labels)
+    df['Mois'] = pd.Categorical(df['Date'].dt.month_name().map(months_fr), categories=month_order, ordered=True)
+    return compact(df)
+
+
+# Conversions vectorisées du classeur des chargeuses (engins.xlsx)
+def prepare_engins(df):
+    df['MOIS'] = map_distinct(df['MOIS'], lambda months: months.str.strip().str.upper().map(month_mapping))
+    df['Date'] = excel_dates_to_datetime(df['Date'])
+    df['Engin'] = extract_equipment_numbers(df['Desc_CA'])
+    df['Montant'] = pd.to_numeric(df['Montant'], errors='coerce')
+    df['Desc_Cat'] = map_distinct(df['Desc_Cat'], lambda labels: labels.str.strip())
+    return df
+
+
+# Mois (en majuscules) déduit de la date, indépendamment de la locale
+def mois_from_date(dates):
+    return dates.dt.month.map(dict(enumerate(MOIS_UPPER, start=1)))
+
+
+# Nettoyage complet de engins.xlsx : conversions, validation et typage dans le même passage.
+# Retourne la frame nettoyée et un QualityReport compact (pas d'affichage ici).
+def clean_engins(df, sample_size=5):
+    total_rows = len(df)
+    df = prepare_engins(df)
+
+    rules = {
+        'DATE_INVALID': ("Lignes avec dates invalides", df['Date'].isna()),
+        'ENGIN_INVALID': ("Lignes avec numéros d'engin invalides", df['Engin'].isna()),
+        'MOIS_INVALID': ("Lignes avec mois invalides", df['MOIS'].isna()),
+        'MONTANT_INVALID': ("Lignes avec montants invalides", df['Montant'].isna()),
+    }
+    issues, samples = check_rules(df, rules, ['Date', 'MOIS', 'Desc_CA', 'Montant'], sample_size)
+
+    # Drop rows with missing critical values (relaxed to allow missing MOIS)
+    dropped = rules['DATE_INVALID'][1] | rules['ENGIN_INVALID'][1] | rules['MONTANT_INVALID'][1]
+    df = df[~dropped].copy()
+
+    # Infer MOIS from Date if missing
+    df.loc[df['MOIS'].isna(), 'MOIS'] = mois_from_date(df['Date'])
+    df['YearMonth'] = df['Date'].dt.to_period('M').astype(str)
+    df['Engin'] = df['Engin'].astype('int32')
+    df = compact(df)
+
+    return df, QualityReport(total_rows, len(df), issues, samples)
@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+import pandas as pd
+
+# Cube journalier : une cellule par site × CATEGORIE × Desc_Cat × Desc_CA × jour (deux sites
+# peuvent avoir un équipement du même nom).
+# 'Montant' y est la somme, ce qui permet aux vues de garder les mêmes noms de colonnes.
+# Sur disque les montants restent en centimes entiers ; sql_store les repasse en DH à la lecture.
+CUBE_DIMENSIONS = ['Site', 'CATEGORIE', 'Desc_Cat', 'Desc_CA', 'Date']
+
+
+# Agréger les lignes brutes en cellules journalières
+def build_cube(df):
+    daily = df.assign(Date=df['Date'].dt.normalize())
+    return daily.groupby(CUBE_DIMENSIONS, observed=True, sort=False)['Montant'].agg(
+        Montant='sum',
+        Nombre='count',
+        Min='min',
+        Max='max'
+    ).reset_index()
+
+
+# Fichier du cube associé à une partie du magasin
+def cube_path(part):
+    return part.replace('.parquet', '.cube.parquet')
+
+
+# Construire et persister le cube d'une partie du magasin
+def write_cube_part(part, df):
+    path = cube_path(part)
+    cube = build_cube(df)
+    # Nom temporaire unique : plusieurs processus peuvent reconstruire le même cube
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    os.close(fd)
+    cube.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return cube
+
+
+# Lire le cube d'une partie ; les magasins créés avant le cube (ou avant le site dans le
+# cube) le construisent une fois ici
+def read_cube_part(part):
+    path = cube_path(part)
+    if os.path.exists(path):
+        cube = pd.read_parquet(path)
+        if set(CUBE_DIMENSIONS) <= set(cube.columns):
+            return cube
+    df = pd.read_parquet(part).drop(columns='_key')
+    try:
+        return write_cube_part(part, df)
+    except (OSError, ValueError, TypeError):
+        return build_cube(df)
+
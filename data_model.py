@@ -0,0 +1,52 @@
+import pandas as pd
+
+# Colonnes de dimension stockées en Categorical : les catégories jouent le rôle de
+# table de dimension et chaque ligne ne garde qu'un code entier
+DIMENSIONS = ['CATEGORIE', 'Desc_Cat', 'Desc_CA', 'Mois', 'MOIS', 'YearMonth', 'Site', 'Source']
+
+# Les montants sont stockés en virgule fixe (centimes entiers) : sommes exactes et
+# colonnes bien compressées dans le magasin Parquet
+AMOUNT_COLUMNS = ['Montant', 'Min', 'Max']
+AMOUNT_SCALE = 100
+
+
+# Convertir les dimensions présentes en Categorical (les ordres déjà définis sont conservés)
+def compact(df):
+    for col in DIMENSIONS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+
+# DH -> centimes entiers (Int64 pour garder les montants manquants)
+def to_fixed(df):
+    df = df.copy()
+    for col in AMOUNT_COLUMNS:
+        if col in df.columns:
+            df[col] = (df[col] * AMOUNT_SCALE).round().astype('Int64')
+    return df
+
+
+# Centimes -> DH pour l'affichage et les calculs
+def from_fixed(df):
+    for col in AMOUNT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('float64') / AMOUNT_SCALE
+    return df
+
+
+# Concaténer des frames compactes sans retomber en chaînes Python :
+# les catégories sont unifiées avant la concaténation
+def concat_compact(frames):
+    frames = [frame for frame in frames if not frame.empty]
+    if len(frames) <= 1:
+        return frames[0] if frames else pd.DataFrame()
+    for col in DIMENSIONS:
+        if col not in frames[0].columns or not isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            continue
+        dtype = frames[0][col].dtype
+        if dtype.ordered:
+            continue
+        categories = pd.api.types.union_categoricals([frame[col] for frame in frames]).categories
+        frames = [frame.assign(**{col: frame[col].cat.set_categories(categories)}) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
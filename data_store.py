@@ -0,0 +1,328 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+import pandas as pd
+
+from cube import cube_path, write_cube_part
+from data_model import concat_compact, to_fixed
+from workbooks import WorkbookSpec, describe_error, find_workbooks, iter_workbook, map_workbooks
+
+# Incrémenter quand le nettoyage ou le format du magasin change
+CACHE_VERSION = 5
+
+# Colonnes qui identifient une ligne de consommation pour la déduplication
+# (deux sites peuvent avoir un équipement de même nom)
+KEY_COLUMNS = ['Date', 'Desc_CA', 'Desc_Cat', 'Montant', 'Site']
+
+MANIFEST = 'manifest.json'
+# Verrou d'écriture du magasin, partagé par les sessions, les processus et les réplicas
+LOCK_FILE = '.lock'
+
+# Répertoires de travail des ingestions, supprimés en fin d'ingestion
+STAGING_PREFIX = 'staging-'
+
+# Classeurs du tableau de bord : un fichier, un répertoire de sites ou un motif glob
+# (voir workbooks.py), ex. ENGINS_DATA=sites/ ou ENGINS_DATA='exports/*.xlsx'
+DATA_SOURCE = os.environ.get('ENGINS_DATA', 'engins2.xlsx')
+
+
+# Signature rapide du fichier source (taille + date de modification)
+def source_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Hash SHA-256 du contenu, lu par blocs pour ne pas charger le classeur en mémoire
+def content_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Hash 64 bits de la clé de déduplication de chaque ligne
+def row_keys(df):
+    return pd.util.hash_pandas_object(df[KEY_COLUMNS], index=False).to_numpy()
+
+
+def _empty_manifest():
+    return {'version': CACHE_VERSION, 'next_part': 0, 'sources': {}, 'failed': {}}
+
+
+def read_manifest(store_dir):
+    try:
+        with open(os.path.join(store_dir, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return _empty_manifest()
+    if manifest.get('version') != CACHE_VERSION:
+        return _empty_manifest()
+    return manifest
+
+
+# Un seul écrivain à la fois par magasin : le manifeste est relu, modifié puis remplacé, et
+# les numéros de partie en viennent. Le système libère le verrou si le processus meurt.
+@contextmanager
+def store_lock(store_dir):
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, LOCK_FILE), 'a+b') as f:
+        if os.name == 'nt':
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK abandonne après une dizaine de secondes : on recommence
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Fichier temporaire au nom unique à côté de `path`, à remplacer ensuite par os.replace
+def _temp_path(path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    os.close(fd)
+    return tmp_path
+
+
+def _write_manifest(store_dir, manifest):
+    path = os.path.join(store_dir, MANIFEST)
+    tmp_path = _temp_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _day(value):
+    return str(pd.Timestamp(value).date())
+
+
+def _select_parts(manifest, start=None, end=None):
+    parts = [part for source in manifest['sources'].values() for part in source['parts']]
+    if start is not None:
+        parts = [part for part in parts if part['end'] >= _day(start)]
+    if end is not None:
+        parts = [part for part in parts if part['start'] <= _day(end)]
+    return sorted(parts, key=lambda part: (part['start'], part['file']))
+
+
+# Parties du magasin triées par date ; avec start/end, seules les partitions
+# mensuelles qui chevauchent la période sont retenues. Sert aussi de version pour les caches.
+def store_parts(store_dir, start=None, end=None):
+    return tuple(
+        os.path.join(store_dir, part['file'])
+        for part in _select_parts(read_manifest(store_dir), start, end)
+    )
+
+
+# Vrai si le classeur est déjà ingéré dans son état actuel (taille, mtime puis hash du contenu)
+def _is_ingested(store_dir, manifest, key, path):
+    known = manifest['sources'].get(key)
+    if not known:
+        return False
+    if not all(os.path.exists(os.path.join(store_dir, part['file'])) for part in known['parts']):
+        return False
+    size, mtime_ns = source_signature(path)
+    if (known['size'], known['mtime_ns']) == (size, mtime_ns):
+        return True
+    # Fichier touché (copie, restauration...) mais contenu identique
+    if known['size'] == size and content_hash(path) == known['sha256']:
+        known['mtime_ns'] = mtime_ns
+        _write_manifest(store_dir, manifest)
+        return True
+    return False
+
+
+# Écrire une partition mensuelle (year=AAAA/month=MM), triée par date, et son cube
+def _write_partition(store_dir, manifest, df):
+    first = df['Date'].iloc[0]
+    part = f"year={first.year}/month={first.month:02d}/part-{manifest['next_part']:05d}.parquet"
+    manifest['next_part'] += 1
+    path = os.path.join(store_dir, part)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = _temp_path(path)
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    # Le cube journalier est construit une fois, au moment de l'ingestion
+    write_cube_part(path, df)
+    return {
+        'file': part,
+        'start': _day(first),
+        'end': _day(df['Date'].iloc[-1]),
+        'rows': len(df),
+    }
+
+
+# Tâche d'un processus du pool : nettoyer un classeur bloc par bloc et déposer chaque bloc,
+# découpé par mois, en Parquet dans `staging_dir`. À la lecture, la mémoire reste bornée par
+# la taille d'un bloc quelle que soit celle du classeur ; l'écriture (_store_workbook) recharge
+# ensuite un mois entier du classeur à la fois. Retourne {mois 'AAAA-MM': [fichiers]}.
+def _stage_workbook(spec, clean, columns, staging_dir):
+    directory = tempfile.mkdtemp(dir=staging_dir)
+    months = {}
+    for i, frame in enumerate(iter_workbook(spec, clean, columns)):
+        frame = frame.dropna(subset=['Date'])
+        for month, piece in frame.groupby(frame['Date'].dt.to_period('M'), sort=True):
+            path = os.path.join(directory, f"{month}-{i:05d}.parquet")
+            piece.to_parquet(path, index=False)
+            months.setdefault(str(month), []).append(path)
+    return months
+
+
+# Supprimer les répertoires de travail abandonnés par une ingestion interrompue (processus
+# tué, OOM). Appelé sous le verrou du magasin : aucune autre ingestion n'est en cours.
+def _clear_stale_staging(store_dir):
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if name.startswith(STAGING_PREFIX) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# Ajouter au magasin les lignes absentes d'un classeur nettoyé, fourni mois par mois
+# (frames nettoyées d'un même mois, chargées ensemble : la mémoire est bornée par un mois de
+# lignes du classeur). Le coût dépend de la taille du classeur : seules les clés des partitions
+# qui chevauchent chaque mois sont relues. Retourne le nombre de lignes ajoutées.
+def _store_workbook(store_dir, manifest, key, signature, months):
+    size, mtime_ns, sha256 = signature
+
+    # Un classeur modifié remplace ses propres partitions ; on déduplique contre les autres
+    previous = manifest['sources'].pop(key, None)
+    parts = []
+    for df in months:
+        df = to_fixed(df)
+        df = df.sort_values('Date', kind='stable')
+        df = df.assign(_key=row_keys(df))
+        existing = [
+            pd.read_parquet(os.path.join(store_dir, part['file']), columns=['_key'])['_key']
+            for part in _select_parts(manifest, df['Date'].iloc[0], df['Date'].iloc[-1])
+        ]
+        if existing:
+            df = df[~df['_key'].isin(pd.concat(existing, ignore_index=True))]
+        if not df.empty:
+            parts.append(_write_partition(store_dir, manifest, df))
+
+    manifest['sources'][key] = {
+        'size': size,
+        'mtime_ns': mtime_ns,
+        'sha256': sha256,
+        'parts': parts,
+        'rows': sum(part['rows'] for part in parts),
+    }
+    _write_manifest(store_dir, manifest)
+
+    for old in (previous['parts'] if previous else []):
+        old_part = os.path.join(store_dir, old['file'])
+        for path in (old_part, cube_path(old_part)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return manifest['sources'][key]['rows']
+
+
+# Échec déjà constaté sur le classeur dans son état actuel : message d'erreur, sinon None
+def _known_failure(manifest, key, signature):
+    failed = manifest['failed'].get(key)
+    if failed and (failed['size'], failed['mtime_ns']) == signature[:2]:
+        return failed['error']
+    return None
+
+
+# Nettoyer et ingérer les classeurs d'une source (fichier, répertoire, motif glob ou liste de
+# WorkbookSpec). Seuls les classeurs nouveaux ou modifiés sont lus, en flux et en parallèle
+# dans un pool de processus, en ne gardant que `columns` ; l'écriture dans le magasin reste
+# séquentielle, un mois à la fois. Un classeur en échec est mémorisé avec sa signature pour
+# ne pas être relu tant qu'il n'a pas changé. Tout se fait sous le verrou du magasin : un
+# appel concurrent attend puis trouve les classeurs déjà ingérés.
+# Retourne ({source: lignes ajoutées}, {source: message d'erreur}).
+def ingest_workbooks(store_dir, source, clean, workers=None, columns=None):
+    specs = [spec for spec in source if isinstance(spec, WorkbookSpec)] or find_workbooks(source)
+    with store_lock(store_dir):
+        return _ingest_locked(store_dir, specs, clean, workers, columns)
+
+
+def _ingest_locked(store_dir, specs, clean, workers, columns):
+    _clear_stale_staging(store_dir)
+    manifest = read_manifest(store_dir)
+    added, errors, pending, signatures = {}, {}, [], {}
+    for spec in specs:
+        try:
+            if _is_ingested(store_dir, manifest, spec.key, spec.path):
+                added[spec.source] = 0
+                continue
+            size, mtime_ns = source_signature(spec.path)
+        except OSError as exc:
+            errors[spec.source] = describe_error(exc)
+            continue
+        failure = _known_failure(manifest, spec.key, (size, mtime_ns))
+        if failure:
+            errors[spec.source] = failure
+            continue
+        signatures[spec.key] = (size, mtime_ns, content_hash(spec.path))
+        pending.append(spec)
+    if not pending:
+        return added, errors
+
+    staging_dir = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=store_dir)
+    try:
+        staged, failures = map_workbooks(_stage_workbook, pending, clean, columns, staging_dir, workers=workers)
+        for spec in pending:
+            if spec.key in failures:
+                size, mtime_ns, _ = signatures[spec.key]
+                errors[spec.source] = describe_error(failures[spec.key])
+                manifest['failed'][spec.key] = {'size': size, 'mtime_ns': mtime_ns, 'error': errors[spec.source]}
+                _write_manifest(store_dir, manifest)
+                continue
+            manifest['failed'].pop(spec.key, None)
+            months = (
+                concat_compact([pd.read_parquet(path) for path in paths])
+                for _, paths in sorted(staged[spec.key].items())
+            )
+            added[spec.source] = _store_workbook(store_dir, manifest, spec.key, signatures[spec.key], months)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return added, errors
+
+
+# Ingestion d'un export mensuel en ligne de commande :
+#   python data_store.py engins2.store export_2025_06.xlsx
+def main():
+    from cleaning import CONSUMPTION_COLUMNS, clean_consumption
+
+    parser = argparse.ArgumentParser(description="Ajouter des classeurs au magasin de consommation")
+    parser.add_argument('store', help="Répertoire du magasin (ex. engins2.store)")
+    parser.add_argument('workbooks', nargs='+',
+                        help="Classeurs .xlsx au schéma de engins2.xlsx, répertoires ou motifs glob")
+    parser.add_argument('--workers', type=int, default=None, help="Processus de lecture (défaut : un par cœur)")
+    args = parser.parse_args()
+    added, errors = ingest_workbooks(
+        args.store, args.workbooks, clean_consumption, args.workers, CONSUMPTION_COLUMNS
+    )
+    for source, rows in added.items():
+        print(f"{source}: {rows} nouvelles lignes")
+    for source, error in errors.items():
+        print(f"{source}: échec ({error})")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,22 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import numpy as np
-from datetime import datetime
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from io import BytesIO
-import plotly.io as pio
-from PIL import Image
 import sqlite3
-import hashlib
+import streamlit.components.v1 as components
+from anomalies import MAX_FLAGS_SHOWN, get_detector
+from chart_data import MAX_POINTS, downsample, fold_top_n, zoom_window
+from cleaning import CONSUMPTION_COLUMNS, clean_consumption, month_order
+from data_store import DATA_SOURCE, ingest_workbooks, store_parts
+from search_index import EquipmentIndex
+from shared_cache import CACHE_FILE, SharedCache, dataset_fingerprint
+from sql_store import (
+    SQL_FILE, SqlAggregator, connection, date_bounds, distinct_values, fetch_rows, sync_sql_store
+)
+from user_store import SESSION_TTL, add_user, check_login, close_session, open_session, session_user
+from timing import ADMINS, Timings, history_frame, last_rerun_frame
+from warmup import WARMUP_ENABLED, WarmUp
+
+STORE_DIR = "engins2.store"
+SESSION_COOKIE = "engins_session"
 
 # Configuration de la page
 st.set_page_config(page_title="Tableau de bord de la consommation des équipements miniers", layout="wide")
@@ -19,40 +25,62 @@ st.set_page_config(page_title="Tableau de bord de la consommation des équipemen
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
     st.session_state.username = ''
-
-# Database Functions
-def create_usertable():
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT)')
-    conn.commit()
-    conn.close()
-
-def add_userdata(username, password):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, password))
-    conn.commit()
-    conn.close()
-
-def login_user(username, password):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('SELECT * FROM users WHERE username = ? AND password = ?', (username, password))
-    data = c.fetchall()
-    conn.close()
-    return data
-
-def make_hashes(password):
-    return hashlib.sha256(str.encode(password)).hexdigest()
-
-def check_hashes(password, hashed_text):
-    if make_hashes(password) == hashed_text:
-        return hashed_text
-    return False
+    st.session_state.session_token = None
+# Un seul onglet à la fois par défaut ; la valeur vit dans l'état de session car le lien
+# « Voir le détail » la modifie
+if 'lazy_tabs' not in st.session_state:
+    st.session_state.lazy_tabs = True
+
+# Préchauffage lancé une fois par processus, dès l'affichage de la page de connexion
+@st.cache_resource
+def start_warmup():
+    return WarmUp(DATA_SOURCE, STORE_DIR, SQL_FILE, CACHE_FILE, clean_consumption, CONSUMPTION_COLUMNS).start()
+
+# Authentification : magasin d'utilisateurs partagé (connexion réutilisée, WAL) et
+# session côté serveur. Le navigateur n'en garde que l'identifiant, dans un cookie (jamais
+# dans l'URL, qui fuit par l'historique, les liens partagés et les journaux des proxys) ;
+# la déconnexion révoque la session dans la base.
+def log_in(username):
+    st.session_state.logged_in = True
+    st.session_state.username = username
+    st.session_state.session_token = open_session(username)
+
+def log_out():
+    close_session(st.session_state.get('session_token'))
+    st.session_state.logged_in = False
+    st.session_state.username = ''
+    st.session_state.session_token = None
+
+# Écrire (ou effacer, max_age=0) le cookie de session depuis le navigateur : Streamlit ne
+# fait que lire les cookies, reçus à l'ouverture de la connexion (st.context.cookies)
+def write_session_cookie(token, max_age=SESSION_TTL):
+    components.html(f"""<script>
+    window.parent.document.cookie = "{SESSION_COOKIE}={token or ''}; Max-Age={max_age}; Path=/; SameSite=Strict"
+        + (window.parent.location.protocol === "https:" ? "; Secure" : "");
+    </script>""", height=0)
+
+def restore_session():
+    # Anciens liens avec le jeton dans l'URL : il n'est plus accepté, le retirer de la barre d'adresse
+    st.query_params.pop('session', None)
+    token = st.context.cookies.get(SESSION_COOKIE)
+    username = session_user(token)
+    if username:
+        st.session_state.logged_in = True
+        st.session_state.username = username
+        st.session_state.session_token = token
+    elif token:
+        # Session expirée ou révoquée
+        write_session_cookie('', max_age=0)
 
 # Authentication Interface
 def auth_page():
+    auth_form()
+    st.stop()
+
+# Formulaire en fragment : changer d'action ou saisir ne relance que lui ;
+# une connexion réussie relance toute l'application (st.rerun)
+@st.fragment
+def auth_form():
     # Center the login form with CSS
 
 
@@ -67,12 +95,8 @@ def auth_page():
             username = st.text_input("Username", key="login_username")
             password = st.text_input("Password", type="password", key="login_password")
             if st.button("Login", key="login_button"):
-                create_usertable()
-                hashed_pswd = make_hashes(password)
-                result = login_user(username, check_hashes(password, hashed_pswd))
-                if result:
-                    st.session_state.logged_in = True
-                    st.session_state.username = username
+                if check_login(username, password):
+                    log_in(username)
                     st.success(f"Logged in as {username}")
                     st.rerun()
                 else:
@@ -83,11 +107,9 @@ def auth_page():
             new_user = st.text_input("New Username", key="signup_username")
             new_password = st.text_input("New Password", type="password", key="signup_password")
             if st.button("Sign Up", key="signup_button"):
-                create_usertable()
                 if new_user and new_password:
-                    hashed_pswd = make_hashes(new_password)
                     try:
-                        add_userdata(new_user, hashed_pswd)
+                        add_user(new_user, new_password)
                         st.success("Account created! Please log in.")
                         st.rerun()
                     except sqlite3.IntegrityError:
@@ -95,10 +117,13 @@ def auth_page():
                 else:
                     st.error("Please enter a username and password.")
         st.markdown('</div>', unsafe_allow_html=True)
-    st.stop()
 
 # Main App
-def main_app():
+def main_app(timings, warmup=None):
+    # Importé ici (et déjà chargé par le préchauffage) : la page de connexion n'en dépend pas
+    import plotly.express as px
+    import plotly.graph_objects as go
+
     st.markdown("""
         <style>
         .stApp { 
@@ -142,60 +167,62 @@ def main_app():
     """, unsafe_allow_html=True)
 
     # Chargement des données
-    @st.cache_data
-    def load_data():
-        df = pd.read_excel("engins2.xlsx")
-        if pd.api.types.is_numeric_dtype(df['Date']):
-            df['Date'] = pd.to_datetime(df['Date'], origin='1899-12-30', unit='D')
-        elif not pd.api.types.is_datetime64_any_dtype(df['Date']):
-            df['Date'] = pd.to_datetime(df['Date'])
-        df = df.dropna(subset=['CATEGORIE', 'Desc_Cat', 'Desc_CA', 'Montant'])
-        df['Montant'] = pd.to_numeric(df['Montant'], errors='coerce')
-        # Clean text columns
-        df['Desc_Cat'] = df['Desc_Cat'].str.strip().str.replace(r'\s+', ' ', regex=True)
-        df['Desc_CA'] = df['Desc_CA'].str.strip().str.replace(r'\s+', ' ', regex=True)
-        # Fix specific typos
-        df['Desc_CA'] = df['Desc_CA'].str.replace('CATERPILLARD', 'CATERPILLAR')
-        df['Desc_CA'] = df['Desc_CA'].str.replace('Nｰ', 'N°')
-        df['Mois'] = df['Date'].dt.month_name()
-        months_fr = {
-            'January': 'Janvier', 'February': 'Février', 'March': 'Mars',
-            'April': 'Avril', 'May': 'Mai', 'June': 'Juin',
-            'July': 'Juillet', 'August': 'Août', 'September': 'Septembre',
-            'October': 'Octobre', 'November': 'Novembre', 'December': 'Décembre'
-        }
-        df['Mois'] = df['Mois'].map(months_fr)
-        
-        return df
+    # Le magasin Parquet évite de re-parser l'Excel à chaque démarrage. Les exports
+    # mensuels y sont ajoutés avec `python data_store.py engins2.store export.xlsx`.
+    # Ses parties sont recopiées une fois dans une base SQLite indexée (Date, CATEGORIE,
+    # Desc_CA, Desc_Cat) : les filtres deviennent des requêtes SQL et seuls les agrégats
+    # ou la page de lignes demandée arrivent dans pandas, pas tout l'historique.
+    @st.cache_resource
+    def sync_database(parts):
+        return sync_sql_store(STORE_DIR, parts, SQL_FILE)
 
-    df = load_data()
-
-    # Calculs en cache
     @st.cache_data
-    def compute_monthly_costs(data):
-        monthly_data = data.groupby('Mois')['Montant'].sum().reset_index()
-        month_order = ['Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
-                       'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre']
-        monthly_data['Mois'] = pd.Categorical(monthly_data['Mois'], categories=month_order, ordered=True)
-        return monthly_data.sort_values('Mois')
+    def load_date_bounds(parts):
+        with connection(SQL_FILE) as conn:
+            return date_bounds(conn)
 
     @st.cache_data
-    def compute_category_breakdown(data):
-        return data.groupby('Desc_Cat')['Montant'].sum().reset_index()
+    def load_sites(parts):
+        with connection(SQL_FILE) as conn:
+            return distinct_values(conn, 'Site')
+
+    # Index de recherche sur les équipements distincts des sites choisis, reconstruit
+    # seulement quand le magasin ou les sites changent
+    @st.cache_resource
+    def load_equipment_index(parts, sites):
+        with connection(SQL_FILE) as conn:
+            return EquipmentIndex(distinct_values(conn, 'Desc_CA', Site=list(sites) if sites is not None else None))
+
+    # Le préchauffage a normalement déjà tout fait : on attend qu'il finisse plutôt que
+    # de refaire le même travail en parallèle
+    with timings.span('chargement'):
+        if warmup is not None:
+            warmup.wait()
+        _, load_errors = ingest_workbooks(STORE_DIR, DATA_SOURCE, clean_consumption, columns=CONSUMPTION_COLUMNS)
+        parts = store_parts(STORE_DIR)
+        sync_database(parts)
+        first_day, last_day = load_date_bounds(parts)
+        sites = load_sites(parts)
+        # Deux sites peuvent avoir un équipement du même nom : filtre par site, et le site
+        # est affiché dans les vues qui listent des équipements quand il y en a plusieurs
+        multi_site = len(sites) > 1
+
+    # Un classeur illisible est signalé, les autres sites restent affichés
+    for source, error in load_errors.items():
+        st.warning(f"Classeur ignoré : {source} ({error})")
 
     # Barre latérale pour les filtres (only visible after login)
-    with st.sidebar:
+    with st.sidebar, timings.span('barre latérale'):
         if st.session_state.logged_in:
             st.write(f"Welcome, {st.session_state.username}!")
             if st.button("Logout", key="logout_button"):
-                st.session_state.logged_in = False
-                st.session_state.username = ''
+                log_out()
                 st.rerun()
             st.subheader("Filtres")
             
             st.subheader("Plage de dates")
-            default_start = df['Date'].min().date()
-            default_end = df['Date'].max().date()
+            default_start = first_day.date()
+            default_end = last_day.date()
             date_range = st.date_input(
                 "Période",
                 value=(default_start, default_end),
@@ -205,172 +232,185 @@ def main_app():
                 key="date_range"
             )
             
+            site_filter = None
+            if multi_site:
+                st.subheader("Sites")
+                selected_sites = st.multiselect("Sélectionner les sites", sites, default=sites, key="site_select")
+                site_filter = None if set(selected_sites) == set(sites) else selected_sites
+            equipment_index = load_equipment_index(parts, None if site_filter is None else tuple(site_filter))
+
             st.subheader("Rechercher un équipement")
             equipment_search = st.text_input("Entrer le nom de l'équipement (correspondance partielle)", "", key="equip_search").strip()
-            if equipment_search:
-                available_equipment = sorted(df[df['Desc_CA'].str.contains(equipment_search, case=False, na=False)]['Desc_CA'].unique())
-            else:
-                available_equipment = sorted(df['Desc_CA'].unique())
+            available_equipment = equipment_index.search(equipment_search)
+            if not available_equipment:
+                # Pas de correspondance exacte : proposer les noms proches (fautes de frappe)
+                available_equipment = equipment_index.suggest(equipment_search)
+                if available_equipment:
+                    st.info("Aucune correspondance exacte, équipements proches proposés.")
             equipment_options = ["Tous les équipements"] + available_equipment
             if not available_equipment:
                 st.warning("Aucun équipement ne correspond au terme de recherche.")
             selected_equipment = st.selectbox("Sélectionner l'équipement", equipment_options, key="equip_select")
 
-    # Appliquer les filtres
-    filtered_data = df.copy()
-    if len(date_range) == 2:
-        start_date, end_date = date_range
-        filtered_data = filtered_data[(filtered_data['Date'].dt.date >= start_date) & 
-                                    (filtered_data['Date'].dt.date <= end_date)]
+            st.subheader("Affichage")
+            lazy_tabs = st.toggle(
+                "Afficher un seul onglet à la fois",
+                key="lazy_tabs",
+                help="Seul l'onglet sélectionné est calculé : plus rapide avec beaucoup de catégories"
+            )
 
-    if selected_equipment != "Tous les équipements":
-        filtered_data = filtered_data[filtered_data['Desc_CA'] == selected_equipment]
+    # Appliquer les filtres
+    # Période, sites et équipement sont traduits en clause WHERE ; chaque regroupement n'est
+    # demandé qu'une fois à SQLite par état de filtres et partagé entre les vues
+    with timings.span('filtres'):
+        start_date, end_date = date_range if len(date_range) == 2 else (default_start, default_end)
+        equipment_filter = None if selected_equipment == "Tous les équipements" else selected_equipment
+        # Les agrégats sont aussi conservés dans un cache disque commun aux réplicas de la
+        # machine, versionné par l'empreinte du magasin : un réplica qui démarre le trouve chaud
+        shared_cache = SharedCache(CACHE_FILE, dataset_fingerprint(parts))
+        agg = SqlAggregator(
+            SQL_FILE, start=start_date, end=end_date, cache=shared_cache, Desc_CA=equipment_filter, Site=site_filter
+        )
 
-    if filtered_data.empty:
-        st.warning("Aucune donnée disponible après filtrage. Veuillez ajuster les filtres.")
-        st.stop()
+        if agg.empty():
+            st.warning("Aucune donnée disponible après filtrage. Veuillez ajuster les filtres.")
+            st.stop()
+        timings.count(len(agg.by(*agg.base_keys)))
+
+    # Tableau croisé du type d'engin sélectionné, en fragment : changer de type ne relance que
+    # cette section, dérivée des regroupements déjà calculés par `agg` pour l'état des filtres
+    @st.fragment
+    def render_engine_pivot(engine_types):
+        with timings.fragment("tableau par type d'engin") as frag:
+            selected_engine = st.selectbox("Sélectionner le type d'engin", engine_types, key="engine_type_select")
+
+            # Pivot table for selected CATEGORIE
+            if not agg.by('CATEGORIE', CATEGORIE=selected_engine).empty:
+                pivot_engine = agg.pivot('Desc_CA', 'Desc_Cat', CATEGORIE=selected_engine)
+                pivot_engine = pivot_engine.round(2)
+                frag.count(len(pivot_engine))
+                frag.measure(pivot_engine)
+                st.dataframe(
+                    pivot_engine.style.format("{:,.2f} DH").set_properties(**{
+                        'background-color': '#424242',
+                        'border': '1px solid #ddd',
+                        'text-align': 'center',
+                        'color': '#FFFFFF'
+                    }).set_table_styles([
+                        {'selector': 'th', 'props': [('background-color', '#424242'), ('color', '#F28C38'), ('font-weight', 'bold')]}
+                    ]),
+                    use_container_width=True
+                )
+            else:
+                st.warning(f"Aucune donnée disponible pour {selected_engine}.")
 
     # Section des indicateurs clés
     kpi_container = st.container()
     with kpi_container:
-        # Calcul des métriques globales
-        total_cost = filtered_data['Montant'].sum()
-        global_avg = filtered_data['Montant'].mean()
+        with timings.span('indicateurs'):
+            # Calcul des métriques globales
+            totals = agg.total()
+            total_cost = totals['Montant']
+            global_avg = total_cost / totals['Nombre']
         
-        # Calcul par catégorie
-        category_stats = filtered_data.groupby('CATEGORIE').agg(
-            Total=('Montant', 'sum'),
-            Moyenne=('Montant', 'mean')
-        ).reset_index()
+            # Calcul par catégorie (moyenne par ligne = somme / nombre de lignes)
+            category_stats = agg.by('CATEGORIE').rename(columns={'Montant': 'Total'})
+            category_stats['Moyenne'] = category_stats['Total'] / category_stats['Nombre']
+            timings.count(len(category_stats))
         
         
-        # Afficher les KPIs
-        st.markdown(f"""
-        <div style='background-color:#424242; padding:15px; border-radius:10px; margin-bottom:20px;'>
-            <h3 style='color:#F28C38; margin-top:0;'>Indicateurs globaux</h3>
-            <div style='display:flex; justify-content:space-between;'>
-                <div style='width:48%; background-color:#424242; padding:10px; border-radius:5px; border-left:4px solid #1976d2;'>
-                    <p style='color:#FFFFFF; font-size:16px;'><b>Coût total</b></p>
-                    <p style='color:#FFFFFF; font-size:24px; font-weight:bold;'>{total_cost:,.0f} DH</p>
-                </div>
-                <div style='width:48%; background-color:#424242; padding:10px; border-radius:5px; border-left:4px solid #388e3c;'>
-                    <p style='color:#FFFFFF; font-size:16px;'><b>Moyenne globale des engin par jour</b></p>
-                    <p style='color:#FFFFFF; font-size:24px; font-weight:bold;'>{global_avg:,.0f} DH</p>
+            # Afficher les KPIs
+            st.markdown(f"""
+            <div style='background-color:#424242; padding:15px; border-radius:10px; margin-bottom:20px;'>
+                <h3 style='color:#F28C38; margin-top:0;'>Indicateurs globaux</h3>
+                <div style='display:flex; justify-content:space-between;'>
+                    <div style='width:48%; background-color:#424242; padding:10px; border-radius:5px; border-left:4px solid #1976d2;'>
+                        <p style='color:#FFFFFF; font-size:16px;'><b>Coût total</b></p>
+                        <p style='color:#FFFFFF; font-size:24px; font-weight:bold;'>{total_cost:,.0f} DH</p>
+                    </div>
+                    <div style='width:48%; background-color:#424242; padding:10px; border-radius:5px; border-left:4px solid #388e3c;'>
+                        <p style='color:#FFFFFF; font-size:16px;'><b>Moyenne globale des engin par jour</b></p>
+                        <p style='color:#FFFFFF; font-size:24px; font-weight:bold;'>{global_avg:,.0f} DH</p>
+                    </div>
                 </div>
             </div>
-        </div>
-        """, unsafe_allow_html=True)
+            """, unsafe_allow_html=True)
         
 
-        # Calculer la consommation la plus consommée par catégorie
-        most_consumed_per_cat = filtered_data.groupby(['CATEGORIE', 'Desc_Cat'])['Montant'].sum().reset_index()
-        most_consumed_per_cat = most_consumed_per_cat.loc[most_consumed_per_cat.groupby('CATEGORIE')['Montant'].idxmax()]
+            # Calculer la consommation la plus consommée par catégorie
+            most_consumed_per_cat = agg.by('CATEGORIE', 'Desc_Cat')
+            most_consumed_per_cat = most_consumed_per_cat.loc[most_consumed_per_cat.groupby('CATEGORIE', observed=True)['Montant'].idxmax()]
 
-        # Créer une colonne pour chaque catégorie
-        categories = category_stats['CATEGORIE'].unique()
-        cols = st.columns(len(categories))
+            # Créer une colonne pour chaque catégorie
+            categories = category_stats['CATEGORIE'].unique()
+            cols = st.columns(len(categories))
 
-        for idx, (col, (_, row)) in enumerate(zip(cols, category_stats.iterrows())):
-            with col:
-                # Trouver la consommation la plus consommée pour cette catégorie
-                most_consumed = most_consumed_per_cat[most_consumed_per_cat['CATEGORIE'] == row['CATEGORIE']]
-                most_consumed_desc = most_consumed['Desc_Cat'].iloc[0] if not most_consumed.empty else "Aucune"
-                most_consumed_amount = most_consumed['Montant'].iloc[0] if not most_consumed.empty else 0
+            for idx, (col, (_, row)) in enumerate(zip(cols, category_stats.iterrows())):
+                with col:
+                    # Trouver la consommation la plus consommée pour cette catégorie
+                    most_consumed = most_consumed_per_cat[most_consumed_per_cat['CATEGORIE'] == row['CATEGORIE']]
+                    most_consumed_desc = most_consumed['Desc_Cat'].iloc[0] if not most_consumed.empty else "Aucune"
+                    most_consumed_amount = most_consumed['Montant'].iloc[0] if not most_consumed.empty else 0
                 
-                st.markdown(f"""
-                <div style='background-color:#424242; padding:15px; border-radius:10px; border-left:4px solid #{'1976d2' if idx%2==0 else '388e3c'}; margin-bottom:10px;'>
-                    <h4 style='color:#F28C38; margin-top:0; text-align:center;'>{row['CATEGORIE']}</h4>
-                    <div style='display:flex; justify-content:space-between; margin-bottom:5px;'>
-                        <span style='color:#FFFFFF;'>Total:</span>
-                        <span style='color:#FFFFFF; font-weight:bold;'>{row['Total']:,.0f} DH</span>
-                    </div>
-                    <div style='display:flex; justify-content:space-between; margin-bottom:5px;'>
-                        <span style='color:#FFFFFF;'>Moyenne:</span>
-                        <span style='color:#FFFFFF; font-weight:bold;'>{row['Moyenne']:,.0f} DH</span>
+                    st.markdown(f"""
+                    <div style='background-color:#424242; padding:15px; border-radius:10px; border-left:4px solid #{'1976d2' if idx%2==0 else '388e3c'}; margin-bottom:10px;'>
+                        <h4 style='color:#F28C38; margin-top:0; text-align:center;'>{row['CATEGORIE']}</h4>
+                        <div style='display:flex; justify-content:space-between; margin-bottom:5px;'>
+                            <span style='color:#FFFFFF;'>Total:</span>
+                            <span style='color:#FFFFFF; font-weight:bold;'>{row['Total']:,.0f} DH</span>
+                        </div>
+                        <div style='display:flex; justify-content:space-between; margin-bottom:5px;'>
+                            <span style='color:#FFFFFF;'>Moyenne:</span>
+                            <span style='color:#FFFFFF; font-weight:bold;'>{row['Moyenne']:,.0f} DH</span>
+                        </div>
                     </div>
-                </div>
-                """, unsafe_allow_html=True)
-
-        # Histogramme des catégories par type de consommation
-        st.markdown("#### Consommation des catégories par type de consommation")
-        hist_data = filtered_data.groupby(['CATEGORIE', 'Desc_Cat'])['Montant'].sum().reset_index()
-        fig_hist = px.bar(
-            hist_data,
-            x='CATEGORIE',
-            y='Montant',
-            color='Desc_Cat',
-            barmode='group',
-            title='Consommation par catégorie et type de consommation',
-            height=500,
-            text='Desc_Cat'
-        )
-        fig_hist.update_traces(
-            texttemplate='%{text}',
-            textposition='inside',
-            textfont=dict(
-                size=30,
-                color='#000000',
-                family='Gravitas One, sans-serif'
+                    """, unsafe_allow_html=True)
+
+        with timings.span('histogramme'):
+            # Histogramme des catégories par type de consommation
+            st.markdown("#### Consommation des catégories par type de consommation")
+            hist_data = agg.by('CATEGORIE', 'Desc_Cat')[['CATEGORIE', 'Desc_Cat', 'Montant']]
+            timings.count(len(hist_data))
+            fig_hist = px.bar(
+                hist_data,
+                x='CATEGORIE',
+                y='Montant',
+                color='Desc_Cat',
+                barmode='group',
+                title='Consommation par catégorie et type de consommation',
+                height=500,
+                text='Desc_Cat'
             )
-        )
-        fig_hist.update_layout(
-            xaxis_title="Catégorie",
-            yaxis_title="Montant total (DH)",
-            template='plotly_white',
-            legend_title="Type de consommation",
-            xaxis={'tickangle': 45},
-            showlegend=False
-        )
-        st.plotly_chart(fig_hist, use_container_width=True, key="category_consumption")
-        
-        # Pivot table for CATEGORIE vs Desc_Cat with Montant
-        st.markdown("#### Consommation totale par type d'engin et catégorie de consommation")
-        pivot_table = pd.pivot_table(
-            filtered_data,
-            values='Montant',
-            index='CATEGORIE',
-            columns='Desc_Cat',
-            aggfunc='sum',
-            fill_value=0,
-            margins=True,
-            margins_name='Total'
-        )
-        # Format Montant as DH with 2 decimals
-        pivot_table = pivot_table.round(2)
-        # Display the table with styling
-        st.dataframe(
-            pivot_table.style.format("{:,.2f} DH").set_properties(**{
-                'background-color': '#424242',
-                'border': '1px solid #ddd',
-                'text-align': 'center',
-                'color': '#FFFFFF'
-            }).set_table_styles([
-                {'selector': 'th', 'props': [('background-color', '#424242'), ('color', '#F28C38'), ('font-weight', 'bold')]}
-            ]),
-            use_container_width=True
-        )
-
-        # Filter for selecting engine type
-        st.markdown("#### Consommation par équipement pour le type d'engin sélectionné")
-        engine_types = sorted(filtered_data['CATEGORIE'].unique())
-        selected_engine = st.selectbox("Sélectionner le type d'engin", engine_types, key="engine_type_select")
-
-        # Pivot table for selected CATEGORIE
-        engine_data = filtered_data[filtered_data['CATEGORIE'] == selected_engine]
-        if not engine_data.empty:
-            pivot_engine = pd.pivot_table(
-                engine_data,
-                values='Montant',
-                index='Desc_CA',
-                columns='Desc_Cat',
-                aggfunc='sum',
-                fill_value=0,
-                margins=True,
-                margins_name='Total'
+            fig_hist.update_traces(
+                texttemplate='%{text}',
+                textposition='inside',
+                textfont=dict(
+                    size=30,
+                    color='#000000',
+                    family='Gravitas One, sans-serif'
+                )
             )
-            pivot_engine = pivot_engine.round(2)
+            fig_hist.update_layout(
+                xaxis_title="Catégorie",
+                yaxis_title="Montant total (DH)",
+                template='plotly_white',
+                legend_title="Type de consommation",
+                xaxis={'tickangle': 45},
+                showlegend=False
+            )
+            st.plotly_chart(timings.measure(fig_hist), use_container_width=True, key="category_consumption")
+        
+        with timings.span('tableaux croisés'):
+            # Pivot table for CATEGORIE vs Desc_Cat with Montant
+            st.markdown("#### Consommation totale par type d'engin et catégorie de consommation")
+            pivot_table = agg.pivot('CATEGORIE', 'Desc_Cat')
+            # Format Montant as DH with 2 decimals
+            pivot_table = pivot_table.round(2)
+            timings.count(len(pivot_table))
+            timings.measure(pivot_table)
+            # Display the table with styling
             st.dataframe(
-                pivot_engine.style.format("{:,.2f} DH").set_properties(**{
+                pivot_table.style.format("{:,.2f} DH").set_properties(**{
                     'background-color': '#424242',
                     'border': '1px solid #ddd',
                     'text-align': 'center',
@@ -380,85 +420,152 @@ def main_app():
                 ]),
                 use_container_width=True
             )
-        else:
-            st.warning(f"Aucune donnée disponible pour {selected_engine}.")
+
+            # Filter for selecting engine type
+            st.markdown("#### Consommation par équipement pour le type d'engin sélectionné")
+            engine_types = sorted(agg.by('CATEGORIE')['CATEGORIE'])
+            render_engine_pivot(engine_types)
     # Onglets pour l'organisation
-    tabs = st.tabs(
-        [f"📋 {cat}" for cat in sorted(filtered_data['CATEGORIE'].unique())] + 
-        ["📊 Analyse comparative", "💡 Recommandations", "📋 Tableau des équipements"]
-    )
+    # Les figures d'un onglet catégorie sont calculées une fois par (catégorie, état des filtres)
+    filter_state = (parts, start_date, end_date, selected_equipment, site_filter)
+
+    @st.cache_data(max_entries=256)
+    def category_tab_figures(cat, filter_state, _agg):
+        cat_equipment = _agg.by('Desc_CA', CATEGORIE=cat)
+
+        # Consommation par équipement : les TOP_N premiers, la queue regroupée dans « Autres »
+        equip_sum, equip_order = fold_top_n(cat_equipment[['Desc_CA', 'Montant']], 'Desc_CA', 'Montant')
+        fig2 = px.bar(
+            equip_sum,
+            x='Desc_CA',
+            y='Montant',
+            title=f'Consommation totale par équipement ({cat})',
+            height=400,
+            text='Montant'
+        )
+        fig2.update_traces(
+            texttemplate='%{text:,.0f} DH',  # Format the text as a number with commas and add "DH"
+            textposition='auto'  # Position the text at the top of each bar
+        )
+        fig2.update_layout(
+            xaxis_title="Équipement",
+            yaxis_title="Montant total (DH)",
+            template='plotly_white',
+            xaxis={'categoryorder': 'array', 'categoryarray': equip_order}
+        )
+
+        # Consommation pour l'équipement sélectionné
+        if selected_equipment == "Tous les équipements" or not (cat_equipment['Desc_CA'] == selected_equipment).any():
+            return fig2, None, None, None
+
+        # Par type de consommation
+        fig3 = px.bar(
+            _agg.by('Desc_Cat', CATEGORIE=cat, Desc_CA=selected_equipment),
+            x='Desc_Cat',
+            y='Montant',
+            title=f'Consommation par type pour {selected_equipment}',
+            height=400
+        )
+        fig3.update_layout(
+            xaxis_title="Type de consommation",
+            yaxis_title="Montant total (DH)",
+            template='plotly_white'
+        )
+
+        # Dans le temps : au plus MAX_POINTS points (LTTB), le détail s'obtient par sélection
+        timeline = _agg.by('Date', CATEGORIE=cat, Desc_CA=selected_equipment)
+        fig4 = px.line(
+            downsample(timeline, 'Date', 'Montant'),
+            x='Date',
+            y='Montant',
+            title=f'Évolution des coûts pour {selected_equipment}',
+            height=400
+        )
+        fig4.update_layout(
+            xaxis_title="Date",
+            yaxis_title="Montant (DH)",
+            template='plotly_white',
+            dragmode='select'
+        )
+        # La série complète sert aussi au zoom : gardée avec les figures
+        return fig2, fig3, fig4, timeline
 
     # Category tabs
-    for i, cat in enumerate(sorted(filtered_data['CATEGORIE'].unique())):
-        with tabs[i]:
-            cat_data = filtered_data[filtered_data['CATEGORIE'] == cat]
-            
-            st.markdown(f"""
-            <div style='background-color:#424242; padding:20px; border-radius:10px; border-left:5px solid #1976d2; margin-bottom:20px;'>
-                <h2 style='color:#F28C38; margin-top:0;'>Analyse pour la catégorie {cat}</h2>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Consommation par équipement
-            st.markdown("#### Consommation par équipement")
-            equip_sum = cat_data.groupby('Desc_CA')['Montant'].sum().reset_index().sort_values('Montant', ascending=False)
-            fig2 = px.bar(
-                equip_sum,
-                x='Desc_CA',
-                y='Montant',
-                title=f'Consommation totale par équipement ({cat})',
-                height=400,
-                text='Montant'
-            )
-            fig2.update_traces(
-                texttemplate='%{text:,.0f} DH',  # Format the text as a number with commas and add "DH"
-                textposition='auto'  # Position the text at the top of each bar
-            )
-            fig2.update_layout(
-                xaxis_title="Équipement",
-                yaxis_title="Montant total (DH)",
-                template='plotly_white',
-                xaxis={'categoryorder':'total descending'}
+    def render_category_tab(cat):
+        fig2, fig3, fig4, timeline = category_tab_figures(cat, filter_state, agg)
+
+        st.markdown(f"""
+        <div style='background-color:#424242; padding:20px; border-radius:10px; border-left:5px solid #1976d2; margin-bottom:20px;'>
+            <h2 style='color:#F28C38; margin-top:0;'>Analyse pour la catégorie {cat}</h2>
+        </div>
+        """, unsafe_allow_html=True)
+
+        st.markdown("#### Consommation par équipement")
+        st.plotly_chart(timings.measure(fig2), use_container_width=True, key=f"equip_sum_{cat}")
+
+        if fig3 is not None:
+            st.markdown(f"#### Consommation pour l'équipement sélectionné: {selected_equipment}")
+            st.plotly_chart(timings.measure(fig3), use_container_width=True, key=f"equip_type_{selected_equipment}_{cat}")
+            event = st.plotly_chart(
+                timings.measure(fig4),
+                use_container_width=True,
+                key=f"equip_time_{selected_equipment}_{cat}",
+                on_select="rerun",
+                selection_mode="box"
             )
-            st.plotly_chart(fig2, use_container_width=True, key=f"equip_sum_{cat}")
-            
-            # Consommation pour l'équipement sélectionné
-            if selected_equipment != "Tous les équipements" and selected_equipment in cat_data['Desc_CA'].unique():
-                st.markdown(f"#### Consommation pour l'équipement sélectionné: {selected_equipment}")
-                equip_data = cat_data[cat_data['Desc_CA'] == selected_equipment]
-                
-                # Par type de consommation
-                fig3 = px.bar(
-                    equip_data.groupby('Desc_Cat')['Montant'].sum().reset_index(),
-                    x='Desc_Cat',
-                    y='Montant',
-                    title=f'Consommation par type pour {selected_equipment}',
-                    height=400
-                )
-                fig3.update_layout(
-                    xaxis_title="Type de consommation",
-                    yaxis_title="Montant total (DH)",
-                    template='plotly_white'
-                )
-                st.plotly_chart(fig3, use_container_width=True, key=f"equip_type_{selected_equipment}_{cat}")
-                
-                # Dans le temps
-                fig4 = px.line(
-                    equip_data.groupby('Date')['Montant'].sum().reset_index(),
+            if len(timeline) > MAX_POINTS:
+                st.caption(f"Courbe réduite à {MAX_POINTS} points sur {len(timeline):,} jours : sélectionnez une période pour la voir en détail.")
+
+            # Période sélectionnée, retracée à pleine résolution (double-clic sur la courbe pour revenir)
+            boxes = event.selection.box if event and event.selection else []
+            window = zoom_window(timeline, 'Date', boxes[0]['x']) if boxes else timeline.iloc[:0]
+            if not window.empty:
+                fig_zoom = px.line(
+                    downsample(window, 'Date', 'Montant'),
                     x='Date',
                     y='Montant',
-                    title=f'Évolution des coûts pour {selected_equipment}',
-                    height=400
+                    title=f"Détail du {window['Date'].min():%d/%m/%Y} au {window['Date'].max():%d/%m/%Y}",
+                    height=400,
+                    markers=len(window) <= 100
                 )
-                fig4.update_layout(
+                fig_zoom.update_layout(
                     xaxis_title="Date",
                     yaxis_title="Montant (DH)",
                     template='plotly_white'
                 )
-                st.plotly_chart(fig4, use_container_width=True, key=f"equip_time_{selected_equipment}_{cat}")
+                st.plotly_chart(timings.measure(fig_zoom), use_container_width=True, key=f"equip_zoom_{selected_equipment}_{cat}")
+
+    # Évolution dans le temps, lue au niveau de cumul choisi (jour, semaine ISO, mois, année).
+    # En fragment : changer de granularité ne relance que ce graphique
+    @st.fragment
+    def render_trend():
+        with timings.fragment('évolution') as frag:
+            st.markdown("#### Évolution des coûts par catégorie")
+            grain_labels = {'day': "Jour", 'week': "Semaine", 'month': "Mois", 'year': "Année"}
+            grain = st.radio(
+                "Granularité", list(grain_labels), index=2, format_func=grain_labels.get,
+                horizontal=True, key="trend_grain"
+            )
+            trend = agg.timeline(grain, 'CATEGORIE')
+            frag.count(len(trend))
+            # Traces construites directement (plotly express coûte ~50 ms de plus par figure)
+            mode = 'lines+markers' if grain in ('month', 'year') else 'lines'
+            fig_trend = go.Figure([
+                go.Scatter(x=series['Date'], y=series['Montant'], mode=mode, name=str(cat))
+                for cat, series in downsample(trend, 'Date', 'Montant', by='CATEGORIE').groupby('CATEGORIE', observed=True)
+            ])
+            fig_trend.update_layout(
+                title=f"Coût par {grain_labels[grain].lower()} et par catégorie",
+                height=400,
+                xaxis_title=grain_labels[grain],
+                yaxis_title="Montant (DH)",
+                template='plotly_white',
+                legend_title="Catégorie"
+            )
+            st.plotly_chart(frag.measure(fig_trend), use_container_width=True, key="trend_by_grain")
 
     # Analyse comparative tab
-    with tabs[-3]:
+    def render_comparison_tab():
         st.markdown("""
         <div style='background-color:#424242; padding:20px; border-radius:10px; border-left:5px solid #388e3c; margin-bottom:20px;'>
             <h2 style='color:#F28C38; margin-top:0;'>Analyse comparative</h2>
@@ -468,7 +575,7 @@ def main_app():
         # Comparaison des catégories
         st.markdown("#### Comparaison des catégories")
         fig_comp = px.bar(
-            filtered_data.groupby('CATEGORIE')['Montant'].sum().reset_index(),
+            agg.by('CATEGORIE'),
             x='CATEGORIE',
             y='Montant',
             title='Coût total par catégorie',
@@ -481,12 +588,54 @@ def main_app():
             yaxis_title="Montant total (DH)",
             template='plotly_white'
         )
-        st.plotly_chart(fig_comp, use_container_width=True, key="category_comparison")
+        st.plotly_chart(timings.measure(fig_comp), use_container_width=True, key="category_comparison")
+
+        render_trend()
+
+        # Comparaison d'une année sur l'autre : mêmes mois, une courbe par année
+        st.markdown("#### Comparaison d'une année sur l'autre")
+        monthly = agg.timeline('month')
+        monthly = monthly.assign(
+            Année=monthly['Date'].dt.year.astype(str),
+            Mois=pd.Categorical(monthly['Date'].dt.month.map(lambda m: month_order[m - 1]), categories=month_order, ordered=True)
+        )
+        fig_yoy = px.line(
+            monthly.sort_values(['Année', 'Mois']),
+            x='Mois',
+            y='Montant',
+            color='Année',
+            title="Coût mensuel par année",
+            height=400,
+            markers=True,
+            category_orders={'Mois': month_order}
+        )
+        fig_yoy.update_layout(
+            xaxis_title="Mois",
+            yaxis_title="Montant (DH)",
+            template='plotly_white'
+        )
+        st.plotly_chart(timings.measure(fig_yoy), use_container_width=True, key="year_over_year")
+        if monthly['Année'].nunique() > 1:
+            yearly = agg.timeline('year')
+            yearly = yearly.assign(Année=yearly['Date'].dt.year.astype(str))
+            # Évolution calculée sur les seuls mois présents les deux années : une année
+            # partielle (début ou fin de la période) n'est pas comparée à une année complète
+            by_month = monthly.pivot_table(index='Mois', columns='Année', values='Montant', aggfunc='sum', observed=True)
+            cols = st.columns(len(yearly))
+            for col, (_, row) in zip(cols, yearly.iterrows()):
+                year, previous = row['Année'], str(int(row['Année']) - 1)
+                delta, help_text = None, None
+                if previous in by_month.columns and year in by_month.columns:
+                    common = by_month[[previous, year]].dropna()
+                    if common[previous].sum():
+                        delta = f"{(common[year].sum() / common[previous].sum() - 1) * 100:+.1f} %"
+                        help_text = f"Par rapport à {previous}, sur les mêmes mois ({len(common)})"
+                col.metric(f"Total {row['Année']}", f"{row['Montant']:,.0f} DH", delta, delta_color="inverse", help=help_text)
         
 
 
     # Recommandations tab
-    with tabs[-2]:
+    def render_recommendations_tab():
         st.markdown("""
         <div style='background-color:#424242; padding:20px; border-radius:10px; border-left:5px solid #8e24aa; margin-bottom:20px;'>
             <h2 style='color:#F28C38; margin-top:0;'>Recommandations</h2>
@@ -494,7 +643,7 @@ def main_app():
         """, unsafe_allow_html=True)
         
         # Top 3 des catégories les plus coûteuses
-        top_categories = filtered_data.groupby('CATEGORIE')['Montant'].sum().nlargest(3).reset_index()
+        top_categories = agg.by('CATEGORIE').nlargest(3, 'Montant')
         
         st.markdown("#### Catégories prioritaires")
         cols = st.columns(3)
@@ -509,20 +658,99 @@ def main_app():
                 </div>
                 """, unsafe_allow_html=True)
         
+        # Semaines anormales : scores de toute la flotte gardés en mémoire par le processus,
+        # seules les semaines touchées par de nouvelles données sont recalculées
+        st.markdown("#### Semaines anormales")
+        with timings.span('anomalies'):
+            detector = get_detector(SQL_FILE)
+            detector.refresh()
+            flags = detector.flagged(start_date, end_date, equipment_filter, site_filter)
+            timings.count(len(flags))
+
+        if flags.empty:
+            st.info("Aucune semaine anormale sur la période sélectionnée.")
+        else:
+            units = (
+                flags.groupby(['Site', 'Desc_CA'], observed=True)
+                .agg(
+                    Catégorie=('CATEGORIE', 'first'), Semaines=('Semaine', 'size'),
+                    Dernière=('Semaine', 'max'), Montant=('Montant', 'sum')
+                )
+                .sort_values(['Dernière', 'Montant'], ascending=False)
+            )
+            cols = st.columns(3)
+            cols[0].metric("Semaines anormales", f"{len(flags):,}")
+            cols[1].metric("Équipements concernés", f"{len(units):,}")
+            cols[2].metric("Montant concerné", f"{flags['Montant'].sum():,.0f} DH")
+
+            # Lien vers le détail : l'équipement choisi devient le filtre de la barre latérale
+            # et l'onglet de sa catégorie s'affiche. st.tabs ne se sélectionne pas par le code :
+            # le lien repasse en affichage d'un seul onglet, dont le choix est un widget.
+            def show_equipment():
+                site, unit = st.session_state.anomaly_unit
+                if multi_site:
+                    st.session_state.site_select = [site]
+                st.session_state.equip_search = ''
+                st.session_state.equip_select = unit
+                st.session_state.lazy_tabs = True
+                st.session_state.active_tab = f"📋 {units.at[(site, unit), 'Catégorie']}"
+
+            def unit_label(key):
+                site, unit = key
+                name = f"{unit} — {site}" if multi_site else unit
+                return f"{name} ({units.at[key, 'Semaines']} sem., dernière le {units.at[key, 'Dernière']:%d/%m/%Y})"
+
+            detail_cols = st.columns([3, 1])
+            detail_cols[0].selectbox(
+                "Équipement à examiner",
+                units.index.tolist(),
+                key="anomaly_unit",
+                format_func=unit_label
+            )
+            detail_cols[1].button("Voir le détail", key="anomaly_detail", on_click=show_equipment, use_container_width=True)
+
+            shown = flags.head(MAX_FLAGS_SHOWN)
+            if not multi_site:
+                shown = shown.drop(columns='Site')
+            shown = shown.rename(columns={
+                'CATEGORIE': 'Catégorie', 'Desc_Cat': 'Type de consommation', 'Desc_CA': 'Équipement',
+                'Montant': 'Montant (DH)'
+            })
+            st.dataframe(
+                timings.measure(shown.style.format({
+                    'Semaine': '{:%d/%m/%Y}',
+                    'Montant (DH)': '{:,.2f} DH',
+                    'Écart historique (z)': '{:.1f}',
+                    'Écart aux pairs (z)': '{:.1f}',
+                    'Saut (×)': '{:.1f}'
+                }, na_rep='')),
+                use_container_width=True,
+                hide_index=True
+            )
+            if len(flags) > MAX_FLAGS_SHOWN:
+                st.caption(f"{MAX_FLAGS_SHOWN} semaines les plus récentes sur {len(flags):,}")
+            st.caption(
+                "Semaine signalée : montant très supérieur aux semaines précédentes de l'équipement "
+                "(historique), aux équipements de même catégorie et type (pairs), "
+                "ou plus du triple de son plus fort montant récent (saut)."
+            )
+
         st.markdown("""
         <div style='background-color:#424242; padding:20px; border-radius:10px; margin-top:20px;'>
             <h3 style='color:#F28C38;'>Actions recommandées</h3>
             <ul style='color:#FFFFFF;'>
                 <li>Prioriser les analyses des équipements dans les catégories les plus coûteuses</li>
-                <li>Mettre en place un suivi mensuel des consommations par catégorie</li>
-                <li>Comparer les performances des équipements similaires pour identifier les anomalies</li>
+                <li>Examiner en premier les équipements signalés sur plusieurs semaines récentes</li>
+                <li>Vérifier les saisies des semaines signalées (quantités, doublons, affectation)</li>
                 <li>Négocier avec les fournisseurs pour les pièces les plus fréquemment remplacées</li>
             </ul>
         </div>
         """, unsafe_allow_html=True)
 
-        # Tableau des équipements tab
-    with tabs[-1]:
+    # Tableau des équipements tab
+    # En fragment : les filtres, le tri et la pagination du tableau ne relancent que cet onglet
+    @st.fragment
+    def render_table_tab():
         st.markdown("""
         <div style='background-color:#424242; padding:20px; border-radius:10px; border-left:5px solid #388e3c; margin-bottom:20px;'>
             <h2 style='color:#F28C38; margin-top:0;'>Tableau de la consommation des équipements</h2>
@@ -532,7 +760,7 @@ def main_app():
         
         # Filter for selecting multiple consumption types
         st.markdown("#### Filtrer par types de consommation")
-        consumption_types = sorted(filtered_data['Desc_Cat'].unique())
+        consumption_types = sorted(agg.by('Desc_Cat')['Desc_Cat'])
         selected_consumptions = st.multiselect(
             "Sélectionner les types de consommation",
             consumption_types,
@@ -541,56 +769,144 @@ def main_app():
             help="Sélectionnez un ou plusieurs types de consommation. Laissez vide pour afficher tous les types."
         )
         
-        # Préparer les données du tableau sans la ligne de total
-        table_df = filtered_data[['Date', 'Desc_CA', 'Desc_Cat', 'Montant']].copy()
-        if selected_consumptions:
-            table_df = table_df[table_df['Desc_Cat'].isin(selected_consumptions)]
+        with timings.fragment('tableau') as frag:
+            # Tableau paginé : filtres, tri et pagination sont faits par SQLite,
+            # seule la page affichée est lue et formatée
+            table_filters = dict(
+                start=start_date,
+                end=end_date,
+                Site=site_filter,
+                Desc_CA=equipment_filter,
+                Desc_Cat=selected_consumptions or None
+            )
+            n_rows = agg.row_count(Desc_Cat=table_filters['Desc_Cat'])
+            frag.count(n_rows)
         
-        if table_df.empty:
-            st.warning("Aucune donnée disponible pour les types de consommation sélectionnés.")
-        else:
-            table_df['Date'] = table_df['Date'].dt.strftime('%d/%m/%Y')
-            table_df['Montant'] = table_df['Montant'].round(2)
-            table_df = table_df.rename(columns={
-                'Date': 'Date',
-                'Desc_CA': 'Équipement',
-                'Desc_Cat': 'Type de consommation',
-                'Montant': 'Montant (DH)'
-            })
+            if not n_rows:
+                st.warning("Aucune donnée disponible pour les types de consommation sélectionnés.")
+            else:
+                columns = {
+                    'Date': 'Date',
+                    **({'Site': 'Site'} if multi_site else {}),
+                    'Desc_CA': 'Équipement',
+                    'Desc_Cat': 'Type de consommation',
+                    'Montant': 'Montant (DH)'
+                }
+                sort_col, order_col, size_col, page_col = st.columns(4)
+                with sort_col:
+                    sort_by = st.selectbox("Trier par", list(columns), format_func=columns.get, key="table_sort")
+                with order_col:
+                    descending = st.toggle("Ordre décroissant", value=False, key="table_desc")
+                with size_col:
+                    page_size = st.selectbox("Lignes par page", [50, 100, 250, 500], index=1, key="table_page_size")
+                n_pages = max(1, -(-n_rows // page_size))
+                if st.session_state.get('table_page', 1) > n_pages:
+                    st.session_state['table_page'] = n_pages
+                with page_col:
+                    page = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, step=1, key="table_page")
+
+                # Le tri se fait sur les valeurs typées ; à égalité l'ordre chronologique est conservé
+                with connection(SQL_FILE) as conn:
+                    page_df = fetch_rows(
+                        conn,
+                        list(columns),
+                        order_by=sort_by,
+                        descending=descending,
+                        limit=page_size,
+                        offset=(page - 1) * page_size,
+                        **table_filters
+                    )
+                page_df['Date'] = page_df['Date'].dt.strftime('%d/%m/%Y')
+                page_df['Montant'] = page_df['Montant'].round(2)
+                page_df = page_df.rename(columns=columns)
+                frag.measure(page_df)
             
-            # Calculer le total pour la colonne 'Montant (DH)'
-            total_montant = table_df['Montant (DH)'].sum()
+                # Le total vient des agrégats, pas de la colonne formatée
+                consumption_totals = agg.by('Desc_Cat')
+                if selected_consumptions:
+                    consumption_totals = consumption_totals[consumption_totals['Desc_Cat'].isin(selected_consumptions)]
+                total_montant = consumption_totals['Montant'].sum()
             
-            # Afficher le tableau avec un fond gris
+                # Afficher la page avec un fond gris
+                st.dataframe(
+                    page_df.style.format({
+                        'Montant (DH)': '{:,.2f} DH',
+                        'Date': lambda x: x if x else ''
+                    }).set_properties(**{
+                        'background-color': '#424242',
+                        'border': '1px solid #ddd',
+                        'text-align': 'center',
+                        'color': '#FFFFFF'
+                    }).set_table_styles([
+                        {'selector': 'th', 'props': [('background-color', '#424242'), ('color', '#F28C38'), ('font-weight', 'bold')]}
+                    ]),
+                    height=600,
+                    use_container_width=True
+                )
+                st.caption(f"Lignes {(page - 1) * page_size + 1} à {min(page * page_size, n_rows)} sur {n_rows:,}")
+            
+                # Afficher le total séparément sous le tableau
+                st.markdown(f"""
+                <div style='background-color:#424242; padding:10px; border-radius:10px; text-align:right; margin-top:10px;'>
+                    <p style='color:#FFFFFF; font-size:16px; font-weight:bold;'>Total : {total_montant:,.2f} DH</p>
+                </div>
+                """, unsafe_allow_html=True)
+
+    tab_labels = (
+        [f"📋 {cat}" for cat in engine_types] +
+        ["📊 Analyse comparative", "💡 Recommandations", "📋 Tableau des équipements"]
+    )
+    tab_renderers = (
+        [lambda cat=cat: render_category_tab(cat) for cat in engine_types] +
+        [render_comparison_tab, render_recommendations_tab, render_table_tab]
+    )
+    if lazy_tabs:
+        # Rendu paresseux : seul l'onglet affiché est calculé et envoyé au navigateur
+        active_tab = st.radio("Vue", tab_labels, horizontal=True, key="active_tab", label_visibility="collapsed")
+        with timings.span(f"onglet {active_tab}"):
+            tab_renderers[tab_labels.index(active_tab)]()
+    else:
+        for label, tab, render in zip(tab_labels, st.tabs(tab_labels), tab_renderers):
+            with tab, timings.span(f"onglet {label}"):
+                render()
+
+    # Passages sur les données filtrées pendant ce rerun (un seul hors vues par date)
+    st.sidebar.caption(
+        f"Agrégations : {agg.scans} passage(s) sur les données filtrées ; "
+        f"cache partagé : {shared_cache.hits} succès, {shared_cache.misses} calcul(s)"
+    )
+    if warmup is not None and warmup.timings:
+        with st.sidebar.expander("Démarrage à froid"):
             st.dataframe(
-                table_df.style.format({
-                    'Montant (DH)': '{:,.2f} DH',
-                    'Date': lambda x: x if x else ''
-                }).set_properties(**{
-                    'background-color': '#424242',
-                    'border': '1px solid #ddd',
-                    'text-align': 'center',
-                    'color': '#FFFFFF'
-                }).set_table_styles([
-                    {'selector': 'th', 'props': [('background-color', '#424242'), ('color', '#F28C38'), ('font-weight', 'bold')]}
-                ]),
-                height=600,
+                pd.Series(warmup.timings, name="Durée (s)").round(3),
                 use_container_width=True
             )
-            
-            # Afficher le total séparément sous le tableau
-            st.markdown(f"""
-            <div style='background-color:#424242; padding:10px; border-radius:10px; text-align:right; margin-top:10px;'>
-                <p style='color:#FFFFFF; font-size:16px; font-weight:bold;'>Total : {total_montant:,.2f} DH</p>
-            </div>
-            """, unsafe_allow_html=True)
+            if warmup.error is not None:
+                st.caption(f"Préchauffage interrompu : {warmup.error}")
+    if timings.enabled and st.session_state.username in ADMINS:
+        with st.sidebar.expander("Durées des derniers reruns"):
+            st.caption("Sections du rerun précédent")
+            st.dataframe(last_rerun_frame('engins_s'), use_container_width=True, hide_index=True)
+            st.caption("Derniers reruns (ms par section)")
+            st.dataframe(history_frame('engins_s'), use_container_width=True, hide_index=True)
 
 # Main Execution
 def main():
+    warmup = start_warmup() if WARMUP_ENABLED else None
+    if not st.session_state.logged_in:
+        restore_session()
     if not st.session_state.logged_in:
         auth_page()
     else:
-        main_app()
+        # Durées des sections de ce rerun (sans effet si ENGINS_PROFILE n'est pas activé)
+        timings = Timings('engins_s', st.session_state.username)
+        # Réémis à l'identique à chaque rerun : le cookie survit au rechargement de la page
+        if st.session_state.get('session_token'):
+            write_session_cookie(st.session_state.session_token)
+        try:
+            main_app(timings, warmup)
+        finally:
+            timings.finish()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
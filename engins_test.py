@@ -2,9 +2,13 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
-import re
 import locale
+import os
+from chart_data import downsample, fold_top_n
+from cleaning import ENGINS_COLUMNS, clean_engins
+from data_model import concat_compact
+from timing import PUBLIC_PANEL, Timings, history_frame, last_rerun_frame
+from workbooks import describe_error, find_workbooks, read_workbooks
 
 # Set French locale for number formatting
 try:
@@ -44,127 +48,87 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Function to convert Excel serial date to datetime
-def excel_date_to_datetime(excel_date):
-    if pd.isna(excel_date) or excel_date is None:
-        return pd.NaT
-    try:
-        # Try parsing as Excel serial date
-        excel_date = float(excel_date)
-        base_date = datetime(1899, 12, 30)
-        return base_date + timedelta(days=excel_date)
-    except (ValueError, TypeError):
-        try:
-            # Try parsing as text date (e.g., "2025-01-01")
-            return pd.to_datetime(excel_date, errors='coerce')
-        except:
-            return pd.NaT
-
-# Function to extract equipment number from description
-def extract_equipment_number(desc):
-    if pd.isna(desc) or desc is None:
-        return None
-    match = re.search(r'N[°ｰ](\d+)', desc, re.IGNORECASE)
-    return int(match.group(1)) if match else None
+# Workbooks to load: a file, a directory of site folders or a glob (see workbooks.py)
+DATA_SOURCE = os.environ.get('ENGINS_TEST_DATA', 'engins.xlsx')
 
-# Function to map French months (keep French names)
-month_mapping = {
-    'JANVIER': 'JANVIER', 'FÉVRIER': 'FÉVRIER', 'MARS': 'MARS', 'AVRIL': 'AVRIL',
-    'MAI': 'MAI', 'JUIN': 'JUIN', 'JUILLET': 'JUILLET', 'AOÛT': 'AOÛT',
-    'SEPTEMBRE': 'SEPTEMBRE', 'OCTOBRE': 'OCTOBRE', 'NOVEMBRE': 'NOVEMBRE', 'DÉCEMBRE': 'DÉCEMBRE'
-}
+# Per-equipment breakdown: units drawn per page and small-multiple panels per row
+EQUIPMENTS_PER_PAGE = 12
+FACET_COLUMNS = 4
 
 # Loading and cleaning data
 @st.cache_data
-def load_data():
-    try:
-        df = pd.read_excel('engins.xlsx')
-    except FileNotFoundError:
-        st.error("Fichier 'engins.xlsx' introuvable. Veuillez vérifier que le fichier est dans le bon répertoire.")
-        return pd.DataFrame()
-
-    # Log raw data
-    st.write("**Échantillon des données brutes (5 premières lignes) :**")
-    st.dataframe(df.head())
-
-    # Cleaning data
-    original_len = len(df)
-
-    # Map months
-    df['MOIS'] = df['MOIS'].str.strip().str.upper().map(month_mapping)
-
-    # Convert dates
-    df['Date'] = df['Date'].apply(excel_date_to_datetime)
-
-    # Extract equipment numbers
-    df['Engin'] = df['Desc_CA'].apply(extract_equipment_number)
-
-    # Convert Montant to numeric
-    df['Montant'] = pd.to_numeric(df['Montant'], errors='coerce')
-    df['Desc_Cat'] = df['Desc_Cat'].str.strip()
-
-    # Log rows with missing or invalid values
-    invalid_dates = df[df['Date'].isna()]
-    if not invalid_dates.empty:
-        st.write(f"**Lignes avec dates invalides ({len(invalid_dates)}) :**")
-        st.dataframe(invalid_dates[['Date', 'MOIS', 'Desc_CA', 'Montant']])
-
-    invalid_equipments = df[df['Engin'].isna()]
-    if not invalid_equipments.empty:
-        st.write(f"**Lignes avec numéros d'engin invalides ({len(invalid_equipments)}) :**")
-        st.dataframe(invalid_equipments[['Date', 'MOIS', 'Desc_CA', 'Montant']])
-
-    invalid_mois = df[df['MOIS'].isna()]
-    if not invalid_mois.empty:
-        st.write(f"**Lignes avec mois invalides ({len(invalid_mois)}) :**")
-        st.dataframe(invalid_mois[['Date', 'MOIS', 'Desc_CA', 'Montant']])
-
-    invalid_montant = df[df['Montant'].isna()]
-    if not invalid_montant.empty:
-        st.write(f"**Lignes avec montants invalides ({len(invalid_montant)}) :**")
-        st.dataframe(invalid_montant[['Date', 'MOIS', 'Desc_CA', 'Montant']])
-
-    # Drop rows with missing critical values (relaxed to allow missing MOIS)
-    df = df.dropna(subset=['Engin', 'Montant', 'Date'])
-    st.write(f"**Lignes après suppression des valeurs manquantes pour Engin, Montant, Date** : {len(df)} (Supprimé {original_len - len(df)} lignes)")
-
-    # Ensure Date is datetime
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-
-    # Log any remaining invalid dates
-    invalid_dates_after = df[df['Date'].isna()]
-    if not invalid_dates_after.empty:
-        st.write(f"**Lignes avec dates invalides après conversion finale ({len(invalid_dates_after)}) :**")
-        st.dataframe(invalid_dates_after[['Date', 'MOIS', 'Desc_CA', 'Montant']])
-        df = df.dropna(subset=['Date'])
-        st.write(f"**Lignes après suppression des dates invalides restantes** : {len(df)}")
-
-    # Infer MOIS from Date if missing
-    df.loc[df['MOIS'].isna(), 'MOIS'] = df['Date'].dt.strftime('%B').str.upper().map({
-        'JANUARY': 'JANVIER', 'FEBRUARY': 'FÉVRIER', 'MARCH': 'MARS', 'APRIL': 'AVRIL',
-        'MAY': 'MAI', 'JUNE': 'JUIN', 'JULY': 'JUILLET', 'AUGUST': 'AOÛT',
-        'SEPTEMBER': 'SEPTEMBRE', 'OCTOBER': 'OCTOBRE', 'NOVEMBER': 'NOVEMBRE', 'DECEMBER': 'DÉCEMBRE'
-    })
-
-    # Creating year-month column for grouping
-    df['YearMonth'] = df['Date'].dt.to_period('M').astype(str)
-
-    # Log final data
-    st.write("**Échantillon des données nettoyées (5 premières lignes) :**")
-    st.dataframe(df.head())
-
-    return df
+def load_data(source=DATA_SOURCE):
+    # Workbooks are streamed in fixed-size chunks (only the columns used here) and cleaned
+    # in a process pool, one per workbook; cleaning and validation run in one vectorized
+    # pass per chunk and the quality reports are compact cached objects rendered on demand
+    # by the diagnostics page. A workbook that fails is reported in `errors` and the
+    # others are still loaded.
+    specs = find_workbooks(source)
+    results, failures = read_workbooks(specs, clean_engins, ENGINS_COLUMNS)
+    # Results are keyed by workbook path (spec.key); labels are only for display
+    frames = [results[spec.key][0] for spec in specs if spec.key in results]
+    reports = {spec.source: results[spec.key][1] for spec in specs if spec.key in results}
+    errors = {spec.source: describe_error(failures[spec.key]) for spec in specs if spec.key in failures}
+    return concat_compact(frames), reports, errors
+
+# Data-quality diagnostics page, one section per workbook
+def render_quality_report(reports, errors):
+    st.header("Diagnostics de la qualité des données")
+    for source, error in errors.items():
+        st.error(f"Classeur ignoré : {source} ({error})")
+    for source, report in reports.items():
+        if len(reports) > 1:
+            st.subheader(source)
+        render_workbook_report(report)
+
+def render_workbook_report(report):
+    st.write(f"**Lignes lues** : {report.total_rows} — **conservées** : {report.kept_rows} (Supprimé {report.dropped_rows} lignes)")
+    st.dataframe(
+        pd.DataFrame([
+            {'Règle': issue.rule, 'Description': issue.label, 'Lignes': issue.count}
+            for issue in report.issues
+        ]),
+        use_container_width=True,
+        hide_index=True
+    )
+    for issue in report.issues:
+        if issue.count:
+            st.write(f"**{issue.label} ({issue.count}) — exemples (lignes Excel {', '.join(str(i + 2) for i in issue.sample_rows)}) :**")
+            st.dataframe(report.samples.loc[issue.sample_rows], use_container_width=True)
 
 # Main dashboard
-def main():
-    df = load_data()
+def main(timings):
+    with timings.span('chargement'):
+        df, reports, errors = load_data()
+        timings.count(len(df))
+
+    if not reports:
+        st.error(f"Aucun classeur lisible pour '{DATA_SOURCE}'. Veuillez vérifier que le fichier est dans le bon répertoire.")
+        for source, error in errors.items():
+            st.caption(f"{source} : {error}")
+        return
 
     if df.empty:
-        st.error("Aucune donnée valide après nettoyage. Veuillez vérifier les problèmes du jeu de données ci-dessus.")
+        st.error("Aucune donnée valide après nettoyage. Veuillez vérifier les problèmes du jeu de données ci-dessous.")
+        render_quality_report(reports, errors)
+        return
+
+    page = st.sidebar.radio("Page", ["Tableau de bord", "Diagnostics des données"], key="page")
+    dropped_rows = sum(report.dropped_rows for report in reports.values())
+    if errors:
+        st.sidebar.caption(f"{len(errors)} classeur(s) ignoré(s) — voir Diagnostics des données")
+    if any(report.has_issues for report in reports.values()):
+        st.sidebar.caption(f"{dropped_rows} lignes supprimées au nettoyage — voir Diagnostics des données")
+    if page == "Diagnostics des données":
+        render_quality_report(reports, errors)
         return
 
     # Sidebar for filters
     st.sidebar.header("Filtres")
+    sites = sorted(df['Site'].unique())
+    if len(sites) > 1:
+        selected_sites = st.sidebar.multiselect("Sélectionner les sites", sites, default=sites)
+        df = df[df['Site'].isin(selected_sites)]
     equipments = sorted(df['Engin'].unique())
     selected_equipments = st.sidebar.multiselect("Sélectionner les engins", equipments, default=equipments)
     months = sorted(df['MOIS'].unique())
@@ -173,11 +137,13 @@ def main():
     selected_categories = st.sidebar.multiselect("Sélectionner les catégories de coûts", categories, default=categories)
 
     # Filtering data
-    filtered_df = df[
-        (df['Engin'].isin(selected_equipments)) &
-        (df['MOIS'].isin(selected_months)) &
-        (df['Desc_Cat'].isin(selected_categories))
-    ]
+    with timings.span('filtres'):
+        filtered_df = df[
+            (df['Engin'].isin(selected_equipments)) &
+            (df['MOIS'].isin(selected_months)) &
+            (df['Desc_Cat'].isin(selected_categories))
+        ]
+        timings.count(len(filtered_df))
 
     if filtered_df.empty:
         st.warning("Aucune donnée disponible pour les filtres sélectionnés.")
@@ -185,120 +151,141 @@ def main():
 
     # Summary metrics
     st.header("Tableau de bord des coûts de maintenance des engins")
-    total_cost = filtered_df['Montant'].sum()
-    avg_cost_per_equipment = filtered_df.groupby('Engin')['Montant'].sum().mean()
-    highest_cost_category = filtered_df.groupby('Desc_Cat')['Montant'].sum().idxmax()
-
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric("Coût total", f"MAD {locale.format_string('%.2f', total_cost, grouping=True)}")
-    with col2:
-        st.metric("Coût moyen par engin", f"MAD {locale.format_string('%.2f', avg_cost_per_equipment, grouping=True)}")
-    with col3:
-        st.metric("Catégorie la plus coûteuse", highest_cost_category)
-
-    # Interesting fact: Equipment with highest tire costs
-    tire_costs = df[df['Desc_Cat'] == 'PNEUMATIQUES'].groupby('Engin')['Montant'].sum()
-    if not tire_costs.empty:
-        max_tire_equipment = tire_costs.idxmax()
-        max_tire_cost = tire_costs.max()
-        st.markdown(f"**Fait intéressant** : L'engin {max_tire_equipment} a les coûts de pneumatiques les plus élevés à MAD {locale.format_string('%.2f', max_tire_cost, grouping=True)}, ce qui peut indiquer une utilisation intensive ou des problèmes de maintenance.")
+    with timings.span('indicateurs'):
+        total_cost = filtered_df['Montant'].sum()
+        avg_cost_per_equipment = filtered_df.groupby('Engin', observed=True)['Montant'].sum().mean()
+        highest_cost_category = filtered_df.groupby('Desc_Cat', observed=True)['Montant'].sum().idxmax()
+        timings.count(len(filtered_df))
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Coût total", f"MAD {locale.format_string('%.2f', total_cost, grouping=True)}")
+        with col2:
+            st.metric("Coût moyen par engin", f"MAD {locale.format_string('%.2f', avg_cost_per_equipment, grouping=True)}")
+        with col3:
+            st.metric("Catégorie la plus coûteuse", highest_cost_category)
+
+        # Interesting fact: Equipment with highest tire costs
+        tire_costs = df[df['Desc_Cat'] == 'PNEUMATIQUES'].groupby('Engin', observed=True)['Montant'].sum()
+        if not tire_costs.empty:
+            max_tire_equipment = tire_costs.idxmax()
+            max_tire_cost = tire_costs.max()
+            st.markdown(f"**Fait intéressant** : L'engin {max_tire_equipment} a les coûts de pneumatiques les plus élevés à MAD {locale.format_string('%.2f', max_tire_cost, grouping=True)}, ce qui peut indiquer une utilisation intensive ou des problèmes de maintenance.")
 
     # Total cost by equipment
     st.subheader("Coût total par engin")
-    cost_by_equipment = filtered_df.groupby('Engin')['Montant'].sum().reset_index()
-    fig1 = px.bar(
-        cost_by_equipment,
-        x='Engin',
-        y='Montant',
-        text='Montant',
-        title="Coût total de maintenance par engin",
-        color_discrete_sequence=['#FFC107']
-    )
-    fig1.update_traces(
-        texttemplate='MAD %{text:,.2f}'.replace(',', ' ').replace('.', ','),
-        textposition='auto'
-    )
-    fig1.update_layout(
-        plot_bgcolor='#1C2526',
-        paper_bgcolor='#1C2526',
-        font_color='#FFC107',
-        xaxis_title="Numéro de l'engin",
-        yaxis_title="Coût total (MAD)",
-        xaxis=dict(tickmode='linear', type='category')
-    )
-    st.plotly_chart(fig1, use_container_width=True)
+    with timings.span('coût par engin'):
+        cost_by_equipment = filtered_df.groupby('Engin', observed=True)['Montant'].sum().reset_index()
+        timings.count(len(cost_by_equipment))
+        fig1 = px.bar(
+            cost_by_equipment,
+            x='Engin',
+            y='Montant',
+            text='Montant',
+            title="Coût total de maintenance par engin",
+            color_discrete_sequence=['#FFC107']
+        )
+        fig1.update_traces(
+            texttemplate='MAD %{text:,.2f}'.replace(',', ' ').replace('.', ','),
+            textposition='auto'
+        )
+        fig1.update_layout(
+            plot_bgcolor='#1C2526',
+            paper_bgcolor='#1C2526',
+            font_color='#FFC107',
+            xaxis_title="Numéro de l'engin",
+            yaxis_title="Coût total (MAD)",
+            xaxis=dict(tickmode='linear', type='category')
+        )
+        st.plotly_chart(timings.measure(fig1), use_container_width=True)
 
     # Cost distribution by category
     st.subheader("Répartition des coûts par catégorie")
-    cost_by_category = filtered_df.groupby('Desc_Cat')['Montant'].sum().reset_index()
-    fig2 = px.pie(
-        cost_by_category,
-        names='Desc_Cat',
-        values='Montant',
-        title="Répartition des coûts par catégorie",
-        color_discrete_sequence=px.colors.sequential.YlOrBr
-    )
-    fig2.update_traces(textinfo='percent+label')
-    fig2.update_layout(
-        plot_bgcolor='#1C2526',
-        paper_bgcolor='#1C2526',
-        font_color='#FFC107'
-    )
-    st.plotly_chart(fig2, use_container_width=True)
+    with timings.span('répartition par catégorie'):
+        cost_by_category = filtered_df.groupby('Desc_Cat', observed=True)['Montant'].sum().reset_index()
+        timings.count(len(cost_by_category))
+        fig2 = px.pie(
+            cost_by_category,
+            names='Desc_Cat',
+            values='Montant',
+            title="Répartition des coûts par catégorie",
+            color_discrete_sequence=px.colors.sequential.YlOrBr
+        )
+        fig2.update_traces(textinfo='percent+label')
+        fig2.update_layout(
+            plot_bgcolor='#1C2526',
+            paper_bgcolor='#1C2526',
+            font_color='#FFC107'
+        )
+        st.plotly_chart(timings.measure(fig2), use_container_width=True)
 
     # Monthly cost trends
     st.subheader("Tendances des coûts mensuels par engin")
-    monthly_costs = filtered_df.groupby(['YearMonth', 'Engin'])['Montant'].sum().reset_index()
-    fig3 = px.line(
-        monthly_costs,
-        x='YearMonth',
-        y='Montant',
-        color='Engin',
-        title="Tendances des coûts mensuels",
-        color_discrete_sequence=px.colors.sequential.YlOrBr
-    )
-    fig3.update_layout(
-        plot_bgcolor='#1C2526',
-        paper_bgcolor='#1C2526',
-        font_color='#FFC107',
-        xaxis_title="Mois",
-        yaxis_title="Coût (MAD)"
-    )
-    st.plotly_chart(fig3, use_container_width=True)
+    with timings.span('tendances mensuelles'):
+        monthly_costs = filtered_df.groupby(['YearMonth', 'Engin'], observed=True)['Montant'].sum().reset_index()
+        # One line per top-cost equipment, the others summed into an "Autres" line
+        monthly_costs, engin_order = fold_top_n(monthly_costs, 'Engin', 'Montant', keys=['YearMonth'])
+        timings.count(len(monthly_costs))
+        fig3 = px.line(
+            downsample(monthly_costs, 'YearMonth', 'Montant', by='Engin'),
+            x='YearMonth',
+            y='Montant',
+            color='Engin',
+            category_orders={'Engin': engin_order},
+            title="Tendances des coûts mensuels",
+            color_discrete_sequence=px.colors.sequential.YlOrBr
+        )
+        fig3.update_layout(
+            plot_bgcolor='#1C2526',
+            paper_bgcolor='#1C2526',
+            font_color='#FFC107',
+            xaxis_title="Mois",
+            yaxis_title="Coût (MAD)"
+        )
+        st.plotly_chart(timings.measure(fig3), use_container_width=True)
+
+    # Per-equipment breakdown: a single Engin x Desc_Cat aggregation feeds the small
+    # multiples below and the comparison chart; only one page of units is drawn per rerun
+    cost_by_equipment_cat = filtered_df.groupby(['Engin', 'Desc_Cat'], observed=True)['Montant'].sum().reset_index()
 
-    # Per-equipment breakdown
     st.subheader("Détail des coûts par engin")
-    for equipment in selected_equipments:
-        st.markdown(f"### Engin {equipment}")
-        equipment_df = filtered_df[filtered_df['Engin'] == equipment]
-        cost_by_cat = equipment_df.groupby('Desc_Cat')['Montant'].sum().reset_index()
+    with timings.span('détail par engin'):
+        n_pages = max(1, -(-len(selected_equipments) // EQUIPMENTS_PER_PAGE))
+        if st.session_state.get('equipment_page', 1) > n_pages:
+            st.session_state['equipment_page'] = n_pages
+        page = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, step=1, key="equipment_page")
+        page_equipments = selected_equipments[(page - 1) * EQUIPMENTS_PER_PAGE:page * EQUIPMENTS_PER_PAGE]
+        page_costs = cost_by_equipment_cat[cost_by_equipment_cat['Engin'].isin(page_equipments)]
+        timings.count(len(page_costs))
 
         fig4 = px.bar(
-            cost_by_cat,
+            page_costs,
             x='Desc_Cat',
             y='Montant',
-            text='Montant',
-            title=f"Coûts par catégorie pour l'engin {equipment}",
+            facet_col='Engin',
+            facet_col_wrap=FACET_COLUMNS,
+            category_orders={'Engin': page_equipments},
+            title="Coûts par catégorie pour chaque engin",
+            height=280 * -(-len(page_equipments) // FACET_COLUMNS) + 100,
             color_discrete_sequence=['#FFC107']
         )
-        fig4.update_traces(
-            texttemplate='MAD %{text:,.2f}'.replace(',', ' ').replace('.', ','),
-            textposition='auto'
-        )
+        fig4.for_each_annotation(lambda a: a.update(text=f"Engin {a.text.split('=')[-1]}"))
+        fig4.update_traces(hovertemplate='%{x}<br>MAD %{y:,.2f}<extra></extra>')
+        fig4.update_xaxes(title_text='', tickangle=45)
+        fig4.update_yaxes(title_text='')
         fig4.update_layout(
             plot_bgcolor='#1C2526',
             paper_bgcolor='#1C2526',
-            font_color='#FFC107',
-            xaxis_title="Catégorie de coût",
-            yaxis_title="Coût (MAD)",
-            xaxis_tickangle=45
+            font_color='#FFC107'
         )
-        st.plotly_chart(fig4, use_container_width=True)
+        st.plotly_chart(timings.measure(fig4), use_container_width=True)
 
-        # Display detailed table
+        # Drill-down: detailed rows of a single unit, formatted only for that unit
+        equipment = st.selectbox("Détail d'un engin", selected_equipments, key="equipment_detail")
+        equipment_df = filtered_df.loc[filtered_df['Engin'] == equipment, ['Date', 'MOIS', 'Desc_Cat', 'Montant']]
+        timings.count(len(equipment_df))
         st.dataframe(
-            equipment_df[['Date', 'MOIS', 'Desc_Cat', 'Montant']].style.format(
+            equipment_df.style.format(
                 {"Montant": lambda x: f"MAD {locale.format_string('%.2f', x, grouping=True)}"}
             ),
             use_container_width=True
@@ -306,25 +293,39 @@ def main():
 
     # Cost comparison across equipments
     st.subheader("Comparaison des coûts entre engins")
-    cost_by_equipment_cat = filtered_df.groupby(['Engin', 'Desc_Cat'])['Montant'].sum().reset_index()
-    fig5 = px.bar(
-        cost_by_equipment_cat,
-        x='Engin',
-        y='Montant',
-        color='Desc_Cat',
-        title="Comparaison des coûts par catégorie entre engins",
-        color_discrete_sequence=px.colors.sequential.YlOrBr
-    )
-    fig5.update_layout(
-        plot_bgcolor='#1C2526',
-        paper_bgcolor='#1C2526',
-        font_color='#FFC107',
-        xaxis_title="Numéro de l'engin",
-        yaxis_title="Coût (MAD)",
-        xaxis=dict(tickmode='linear', type='category'),
-        barmode='stack'
-    )
-    st.plotly_chart(fig5, use_container_width=True)
+    with timings.span('comparaison entre engins'):
+        timings.count(len(cost_by_equipment_cat))
+        fig5 = px.bar(
+            cost_by_equipment_cat,
+            x='Engin',
+            y='Montant',
+            color='Desc_Cat',
+            title="Comparaison des coûts par catégorie entre engins",
+            color_discrete_sequence=px.colors.sequential.YlOrBr
+        )
+        fig5.update_layout(
+            plot_bgcolor='#1C2526',
+            paper_bgcolor='#1C2526',
+            font_color='#FFC107',
+            xaxis_title="Numéro de l'engin",
+            yaxis_title="Coût (MAD)",
+            xaxis=dict(tickmode='linear', type='category'),
+            barmode='stack'
+        )
+        st.plotly_chart(timings.measure(fig5), use_container_width=True)
+
+    # No login here, so no admin check is possible: the panel is opt-in (ENGINS_PROFILE_PANEL=1)
+    if timings.enabled and PUBLIC_PANEL:
+        with st.sidebar.expander("Durées des derniers reruns"):
+            st.caption("Sections du rerun précédent")
+            st.dataframe(last_rerun_frame('engins_test'), use_container_width=True, hide_index=True)
+            st.caption("Derniers reruns (ms par section)")
+            st.dataframe(history_frame('engins_test'), use_container_width=True, hide_index=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Section timings for this rerun (no-op unless ENGINS_PROFILE=1)
+    timings = Timings('engins_test')
+    try:
+        main(timings)
+    finally:
+        timings.finish()
\ No newline at end of file
@@ -0,0 +1,53 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+# Lignes par bloc : la mémoire de lecture dépend de ce nombre, pas de la taille du classeur
+CHUNK_ROWS = 50_000
+
+
+def _is_blank(row):
+    return all(value is None or value == '' for value in row)
+
+
+# Lire une feuille en flux (openpyxl en lecture seule) par blocs de `chunk_rows` lignes,
+# en ne gardant que les colonnes `columns` (toutes sinon). Chaque bloc est une frame dont
+# l'index continue celui de la feuille (ligne Excel = indice + 2), comme pd.read_excel ;
+# les lignes vides en fin de feuille sont ignorées comme le fait pd.read_excel.
+def read_excel_chunks(path, sheet=None, columns=None, chunk_rows=CHUNK_ROWS):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet is not None else workbook.worksheets[0]
+        # Les dimensions déclarées dans le fichier peuvent être fausses (exports générés)
+        worksheet.reset_dimensions()
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        names = [str(name).strip() if name is not None else '' for name in header]
+        wanted = list(columns) if columns is not None else [name for name in names if name]
+        missing = [name for name in wanted if name not in names]
+        if missing:
+            raise ValueError(f"colonnes absentes : {', '.join(missing)}")
+        positions = [names.index(name) for name in wanted]
+
+        block, start, blank = [], 0, 0
+        for row in rows:
+            if _is_blank(row):
+                # Gardée seulement si une ligne non vide suit
+                blank += 1
+                continue
+            block.extend([(None,) * len(positions)] * blank)
+            blank = 0
+            block.append(tuple(row[i] if i < len(row) else None for i in positions))
+            if len(block) >= chunk_rows:
+                yield _frame(block, wanted, start)
+                start += len(block)
+                block = []
+        if block or not start:
+            yield _frame(block, wanted, start)
+    finally:
+        workbook.close()
+
+
+def _frame(block, columns, start):
+    frame = pd.DataFrame.from_records(block, columns=columns, nrows=len(block))
+    frame.index = pd.RangeIndex(start, start + len(frame))
+    return frame
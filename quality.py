@@ -0,0 +1,64 @@
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+
+# Une règle de validation violée : identifiant, libellé, nombre de lignes et
+# indices d'un petit échantillon (numéro de ligne Excel = indice + 2)
+@dataclass
+class QualityIssue:
+    rule: str
+    label: str
+    count: int
+    sample_rows: list
+
+
+# Rapport compact produit pendant le nettoyage : sa taille ne dépend pas du nombre de
+# lignes invalides, seuls quelques exemples par règle sont conservés
+@dataclass
+class QualityReport:
+    total_rows: int
+    kept_rows: int
+    issues: list = field(default_factory=list)
+    samples: pd.DataFrame = field(default_factory=pd.DataFrame)
+
+    @property
+    def dropped_rows(self):
+        return self.total_rows - self.kept_rows
+
+    @property
+    def has_issues(self):
+        return any(issue.count for issue in self.issues)
+
+
+# Évaluer des masques de règles {rule: (libellé, masque booléen)} sur une frame
+def check_rules(df, rules, columns, sample_size=5):
+    issues = []
+    sample_index = []
+    for rule, (label, mask) in rules.items():
+        rows = df.index[mask]
+        issues.append(QualityIssue(rule, label, len(rows), rows[:sample_size].tolist()))
+        sample_index.extend(rows[:sample_size])
+    samples = df.loc[pd.Index(sample_index).unique(), columns]
+    return issues, samples
+
+
+# Fusionner les rapports des blocs successifs d'une même feuille : compteurs additionnés,
+# premiers exemples de chaque règle conservés (les indices des blocs se suivent)
+def merge_reports(reports, sample_size=5):
+    if len(reports) == 1:
+        return reports[0]
+    issues = {}
+    for report in reports:
+        for issue in report.issues:
+            merged = issues.setdefault(issue.rule, QualityIssue(issue.rule, issue.label, 0, []))
+            merged.count += issue.count
+            merged.sample_rows.extend(issue.sample_rows[:sample_size - len(merged.sample_rows)])
+    samples = pd.concat([report.samples for report in reports])
+    sample_index = pd.Index([row for issue in issues.values() for row in issue.sample_rows]).unique()
+    return QualityReport(
+        sum(report.total_rows for report in reports),
+        sum(report.kept_rows for report in reports),
+        list(issues.values()),
+        samples[~samples.index.duplicated()].loc[sample_index]
+    )
@@ -0,0 +1,236 @@
+import argparse
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+
+import pandas as pd
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.shared import Inches, Pt
+
+from aggregates import BASE_KEYS, Aggregator
+from cleaning import month_order
+from shared_cache import CACHE_FILE, SharedCache, dataset_fingerprint
+from sql_store import SQL_FILE, SqlAggregator
+
+# Libellés des colonnes dans les documents
+LABELS = {
+    'CATEGORIE': "Catégorie",
+    'Desc_CA': "Équipement",
+    'Desc_Cat': "Type de consommation",
+    'Nombre': "Interventions",
+}
+
+# Nombre d'équipements listés dans le classement de chaque catégorie
+TOP_EQUIPMENT = 10
+
+
+def _money(value):
+    return f"{value:,.2f} DH"
+
+
+def _new_document():
+    doc = Document()
+    for section in doc.sections:
+        section.left_margin = section.right_margin = Inches(0.7)
+    doc.styles['Normal'].font.size = Pt(10)
+    return doc
+
+
+def _title(doc, text, subtitle):
+    heading = doc.add_heading(text, level=0)
+    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    paragraph = doc.add_paragraph(subtitle)
+    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+
+# Tableau Word à partir d'une frame ; les colonnes de montants sont formatées en DH
+def _add_table(doc, frame, money_columns=()):
+    table = doc.add_table(rows=1, cols=len(frame.columns))
+    table.style = 'Table Grid'
+    for cell, col in zip(table.rows[0].cells, frame.columns):
+        cell.text = LABELS.get(col, str(col))
+        cell.paragraphs[0].runs[0].bold = True
+    for row in frame.itertuples(index=False):
+        for cell, col, value in zip(table.add_row().cells, frame.columns, row):
+            cell.text = _money(value) if col in money_columns else str(value)
+            if col in money_columns:
+                cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    return table
+
+
+# Tableau croisé avec marges 'Total' mis à plat pour _add_table
+def _pivot_frame(agg, index, columns, **where):
+    table = agg.pivot(index, columns, **where).round(2)
+    table.columns = [str(col) for col in table.columns]
+    return table.rename_axis(index).reset_index(), list(table.columns)
+
+
+# Indicateurs globaux et tableau croisé CATEGORIE × type de consommation ; pour le rapport
+# autonome d'une catégorie `cat`, `agg` n'en contient que les lignes : les indicateurs sont
+# titrés à son nom et la répartition par catégorie (une seule ligne à 100 %) est omise
+def _add_overview(doc, agg, cat=None):
+    totals = agg.total()
+    doc.add_heading("Indicateurs globaux" if cat is None else f"Indicateurs de la catégorie {cat}", level=1)
+    _add_table(doc, pd.DataFrame([
+        {'Indicateur': "Coût total", 'Valeur': _money(totals['Montant'])},
+        {'Indicateur': "Nombre d'interventions", 'Valeur': f"{int(totals['Nombre']):,}"},
+        {'Indicateur': "Moyenne par intervention", 'Valeur': _money(totals['Montant'] / totals['Nombre'])},
+    ]))
+
+    if cat is not None:
+        return
+
+    doc.add_heading("Coût par catégorie", level=1)
+    categories = agg.by('CATEGORIE')
+    categories = categories.assign(
+        Part=(categories['Montant'] / totals['Montant'] * 100).round(1).astype(str) + ' %'
+    )
+    _add_table(doc, categories[['CATEGORIE', 'Montant', 'Nombre', 'Part']], money_columns=['Montant'])
+
+    doc.add_heading("Consommation par catégorie et type de consommation", level=1)
+    pivot, money_columns = _pivot_frame(agg, 'CATEGORIE', 'Desc_Cat')
+    _add_table(doc, pivot, money_columns)
+
+
+# Section d'une catégorie : classement des équipements et tableau par équipement
+def _add_category_section(doc, agg, cat):
+    doc.add_heading(f"Catégorie {cat}", level=1)
+    equipment = agg.by('Desc_CA', CATEGORIE=cat).nlargest(TOP_EQUIPMENT, 'Montant')
+    doc.add_heading(f"Top {len(equipment)} des équipements", level=2)
+    _add_table(doc, equipment[['Desc_CA', 'Montant', 'Nombre']], money_columns=['Montant'])
+
+    doc.add_heading("Consommation par équipement et type de consommation", level=2)
+    pivot, money_columns = _pivot_frame(agg, 'Desc_CA', 'Desc_Cat', CATEGORIE=cat)
+    _add_table(doc, pivot, money_columns)
+
+
+# Tâche d'un processus du pool : écrire sur disque le document d'une catégorie à partir
+# de son extrait du regroupement de base (quelques centaines de lignes, pas les données brutes)
+def _write_category_report(cat, base, period, path, standalone):
+    agg = Aggregator(base)
+    doc = _new_document()
+    if standalone:
+        _title(doc, f"Rapport de consommation — {cat}", period)
+        _add_overview(doc, agg, cat)
+    _add_category_section(doc, agg, cat)
+    doc.save(path)
+    return path
+
+
+# Recopier le corps d'un document (titres, paragraphes, tableaux) à la suite d'un autre
+def _append_body(doc, path):
+    body = doc.element.body
+    for element in Document(path).element.body:
+        if element.tag.endswith('}sectPr'):
+            continue
+        body.insert(len(body) - 1, deepcopy(element))
+
+
+def _period(year, month=None):
+    if month is None:
+        return pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31), str(year), f"Année {year}"
+    start = pd.Timestamp(year, month, 1)
+    end = start + pd.offsets.MonthEnd(0)
+    return start, end, f"{year}-{month:02d}", f"{month_order[month - 1]} {year}"
+
+
+def _safe_name(text):
+    return re.sub(r'[^\w-]+', '_', str(text)).strip('_')
+
+
+# Générer les rapports d'une période, pour un site ou pour tous : un document par catégorie
+# et/ou un document consolidé. Un seul passage SQL (via le cache partagé) fournit le
+# regroupement de base ; les sections sont construites en parallèle et écrites directement sur disque.
+def generate_reports(out_dir, year, month=None, per_category=True, consolidated=True,
+                     parts=(), sql_file=SQL_FILE, cache_file=CACHE_FILE, workers=None, site=None):
+    start, end, label, period = _period(year, month)
+    if site is not None:
+        label, period = f"{label}_{_safe_name(site)}", f"{period} — site {site}"
+    cache = SharedCache(cache_file, dataset_fingerprint(parts)) if parts else None
+    agg = SqlAggregator(sql_file, BASE_KEYS + ('Site',), start=start, end=end, cache=cache, Site=site)
+    if agg.empty():
+        return []
+    base = agg.by(*agg.base_keys)
+    # Deux sites peuvent avoir un équipement du même nom : avec plusieurs sites, chaque
+    # équipement est désigné avec son site pour que les homonymes restent distincts
+    if base['Site'].nunique() > 1:
+        base = base.assign(Desc_CA=base['Desc_CA'].astype(str) + ' — ' + base['Site'].astype(str))
+    base = base.drop(columns='Site')
+    categories = sorted(base['CATEGORIE'].unique())
+
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir, ProcessPoolExecutor(workers) as pool:
+        futures = {}
+        for cat in categories:
+            if per_category:
+                path = os.path.join(out_dir, f"rapport_{label}_{_safe_name(cat)}.docx")
+                futures[pool.submit(
+                    _write_category_report, cat, base[base['CATEGORIE'] == cat], period, path, True
+                )] = None
+            if consolidated:
+                path = os.path.join(tmp_dir, f"{_safe_name(cat)}.docx")
+                futures[pool.submit(
+                    _write_category_report, cat, base[base['CATEGORIE'] == cat], period, path, False
+                )] = cat
+        sections = {}
+        for future, cat in futures.items():
+            if cat is None:
+                written.append(future.result())
+            else:
+                sections[cat] = future.result()
+
+        if consolidated:
+            doc = _new_document()
+            _title(doc, "Rapport de consommation des engins", period)
+            _add_overview(doc, agg)
+            for cat in categories:
+                doc.add_page_break()
+                _append_body(doc, sections[cat])
+            path = os.path.join(out_dir, f"rapport_{label}.docx")
+            doc.save(path)
+            written.append(path)
+    return written
+
+
+# Génération en ligne de commande (sans Streamlit) :
+#   python reports.py --year 2024 --month 6 --out rapports
+def main():
+    from cleaning import CONSUMPTION_COLUMNS, clean_consumption
+    from data_store import DATA_SOURCE, ingest_workbooks, store_parts
+    from sql_store import sync_sql_store
+
+    parser = argparse.ArgumentParser(description="Rapports DOCX de consommation des engins")
+    parser.add_argument('--year', type=int, required=True)
+    parser.add_argument('--month', type=int, choices=range(1, 13), help="Mois (1-12) ; l'année entière sinon")
+    parser.add_argument('--out', default='rapports', help="Répertoire de sortie")
+    parser.add_argument('--mode', choices=['tous', 'categorie', 'consolide'], default='tous',
+                        help="Un document par catégorie, un document consolidé, ou les deux")
+    parser.add_argument('--workers', type=int, default=None, help="Processus (défaut : nombre de cœurs)")
+    parser.add_argument('--site', default=None, help="Site à couvrir (défaut : tous les sites)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    # Mettre le magasin et la base SQLite à jour comme au démarrage du tableau de bord
+    ingest_workbooks('engins2.store', DATA_SOURCE, clean_consumption, columns=CONSUMPTION_COLUMNS)
+    parts = store_parts('engins2.store')
+    sync_sql_store('engins2.store', parts, SQL_FILE)
+    written = generate_reports(
+        args.out, args.year, args.month,
+        per_category=args.mode in ('tous', 'categorie'),
+        consolidated=args.mode in ('tous', 'consolide'),
+        parts=parts,
+        workers=args.workers,
+        site=args.site
+    )
+    for path in written:
+        print(path)
+    print(f"{len(written)} document(s) en {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
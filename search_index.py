@@ -0,0 +1,67 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+# Variantes du signe "numéro" rencontrées dans les exports (N°, Nｰ, Nº, N ー)
+NUMBER_SIGNS = str.maketrans('', '', '°ｰºー')
+
+
+# Clé de recherche : sans accents, insensible à la casse, signes "numéro" et espaces normalisés
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text).translate(NUMBER_SIGNS))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return re.sub(r'\s+', ' ', text.translate(NUMBER_SIGNS)).strip()
+
+
+def trigrams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+# Index trigrammes sur les noms d'équipement distincts : une recherche ne dépend
+# que du nombre d'équipements, pas du nombre de lignes de consommation
+class EquipmentIndex:
+    def __init__(self, names):
+        self.names = sorted(names)
+        self.keys = [normalize(name) for name in self.names]
+        self.postings = defaultdict(set)
+        for i, key in enumerate(self.keys):
+            for gram in trigrams(key):
+                self.postings[gram].add(i)
+
+    # Correspondances par sous-chaîne, préfixes et débuts de mot en premier
+    def search(self, query):
+        query = normalize(query)
+        if not query:
+            return list(self.names)
+        grams = trigrams(query)
+        if grams:
+            # Intersection en partant de la liste la plus courte
+            postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            candidates = range(len(self.keys))
+        matches = [i for i in candidates if query in self.keys[i]]
+        matches.sort(key=lambda i: (
+            not self.keys[i].startswith(query),
+            f" {query}" not in f" {self.keys[i]}",
+            self.names[i]
+        ))
+        return [self.names[i] for i in matches]
+
+    # Correspondances approchées (fautes de frappe) classées par trigrammes communs
+    def suggest(self, query, limit=10, min_score=0.5):
+        grams = trigrams(normalize(query))
+        if not grams:
+            return []
+        shared = defaultdict(int)
+        for gram in grams:
+            for i in self.postings.get(gram, ()):
+                shared[i] += 1
+        scored = []
+        for i, count in shared.items():
+            # Part des trigrammes de la requête retrouvés, puis similarité globale
+            coverage = count / len(grams)
+            if coverage >= min_score:
+                similarity = count / len(grams | trigrams(self.keys[i]))
+                scored.append((-coverage, -similarity, self.names[i]))
+        return [name for _, _, name in sorted(scored)[:limit]]
@@ -0,0 +1,142 @@
+import hashlib
+import pickle
+import threading
+import time
+
+from sqlite_pool import get_pool
+
+# Cache disque partagé par tous les processus Streamlit d'une machine : un réplica
+# qui démarre retrouve les agrégats déjà calculés par les autres
+CACHE_FILE = 'engins2.cache.sqlite'
+
+# Taille maximale des valeurs conservées ; au-delà les moins récemment lues sont évincées
+MAX_BYTES = 256 * 1024 * 1024
+
+# Les dates d'accès des lectures sont gardées en mémoire et écrites par lots, au plus une
+# fois par TOUCH_INTERVAL secondes et par processus (ou avec l'écriture suivante)
+TOUCH_INTERVAL = 60
+
+# Entrées d'une autre version du jeu de données supprimées après STALE_AFTER secondes sans
+# lecture : pendant une ingestion, les réplicas encore sur l'ancienne version la gardent à jour
+STALE_AFTER = 3600
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY, version TEXT, value BLOB, size INTEGER, accessed REAL)''',
+    'CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)',
+    'CREATE INDEX IF NOT EXISTS entries_version ON entries (version)',
+]
+
+
+def _create_schema(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+# Dates d'accès en attente par base : {chemin: {clé: date}}, et date de la dernière écriture
+_touches = {}
+_flushed = {}
+_touch_lock = threading.Lock()
+
+
+# Empreinte du jeu de données : les noms des parties du magasin sont uniques et
+# changent à chaque ingestion, ils suffisent à versionner les résultats
+def dataset_fingerprint(parts):
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()[:16]
+
+
+def cache_key(name, args):
+    return hashlib.sha256(repr((name, args)).encode()).hexdigest()
+
+
+# Cache clé/valeur (pickle) versionné par empreinte du jeu de données, borné en taille (LRU).
+# Les écritures concurrentes sont sérialisées par SQLite (WAL, transaction courte).
+class SharedCache:
+    def __init__(self, path=CACHE_FILE, version='', max_bytes=MAX_BYTES):
+        self.path = path
+        self.version = version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        return get_pool(self.path, _create_schema).connection()
+
+    def get(self, key):
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT value FROM entries WHERE key = ? AND version = ?', (key, self.version)
+            ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        with _touch_lock:
+            _touches.setdefault(self.path, {})[key] = now
+            due = now - _flushed.get(self.path, 0) > TOUCH_INTERVAL
+        if due:
+            with self._connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    self._flush_touches(conn)
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+        return pickle.loads(row[0])
+
+    # Écrire en une fois les dates d'accès en attente (dans la transaction en cours)
+    def _flush_touches(self, conn):
+        with _touch_lock:
+            pending = _touches.pop(self.path, {})
+            _flushed[self.path] = time.time()
+        conn.executemany(
+            'UPDATE entries SET accessed = MAX(accessed, ?) WHERE key = ?',
+            [(accessed, key) for key, accessed in pending.items()]
+        )
+
+    def set(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._flush_touches(conn)
+                # Les autres versions ne sont pas effacées d'emblée : un réplica qui n'a pas encore
+                # vu la nouvelle ingestion les lit encore. Elles partent quand plus personne ne les lit.
+                conn.execute(
+                    'DELETE FROM entries WHERE version != ? AND accessed < ?', (self.version, time.time() - STALE_AFTER)
+                )
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                    (key, self.version, blob, len(blob), time.time())
+                )
+                self._evict(conn)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    # Supprimer les entrées les moins récemment lues jusqu'à repasser sous la limite
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        for key, size in conn.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+    # Valeur en cache pour (name, args), sinon calculée une fois et partagée
+    def get_or_compute(self, name, args, compute):
+        key = cache_key(name, args)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        self.set(key, value)
+        return value
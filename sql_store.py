@@ -0,0 +1,365 @@
+import os
+
+import pandas as pd
+
+from aggregates import BASE_KEYS, Aggregator
+from cube import CUBE_DIMENSIONS, read_cube_part
+from data_model import from_fixed
+from sqlite_pool import get_pool
+
+# Base SQL locale interrogée par le tableau de bord. Le magasin Parquet reste la source
+# (ingestion, déduplication) ; chaque partie immuable y est recopiée une seule fois.
+SQL_FILE = 'engins2.sqlite'
+
+# Colonnes filtrables par égalité ou par liste de valeurs
+FILTER_COLUMNS = ('Site', 'CATEGORIE', 'Desc_Cat', 'Desc_CA')
+ROW_COLUMNS = ['Date', 'Site', 'CATEGORIE', 'Desc_Cat', 'Desc_CA', 'Montant']
+MEASURE_COLUMNS = ['Montant', 'Nombre', 'Min', 'Max']
+
+# Cumuls pré-agrégés du cube par période, en plus du niveau jour (le cube lui-même) :
+# 'Date' y est le premier jour de la période (lundi de la semaine ISO, 1er du mois,
+# 1er janvier). Chaque expression SQL ramène une date du cube au début de sa période.
+ROLLUP_GRAINS = {
+    'week': "date(Date, 'weekday 0', '-6 days')",
+    'month': "substr(Date, 1, 7) || '-01'",
+    'year': "substr(Date, 1, 4) || '-01-01'",
+}
+GRAINS = ('day',) + tuple(ROLLUP_GRAINS)
+
+# Version du schéma (PRAGMA user_version). La base n'étant qu'une copie du magasin, une
+# base d'une autre version est vidée et recopiée entièrement au prochain alignement.
+SCHEMA_VERSION = 2
+TABLES = ['parts', 'consumption', 'cube'] + [f'rollup_{grain}' for grain in ROLLUP_GRAINS]
+
+# Montants en centimes entiers, comme dans le magasin Parquet
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS parts (file TEXT PRIMARY KEY)',
+    '''CREATE TABLE IF NOT EXISTS consumption (
+        part TEXT, Date TEXT, Site TEXT, CATEGORIE TEXT, Desc_Cat TEXT, Desc_CA TEXT, Montant INTEGER)''',
+    '''CREATE TABLE IF NOT EXISTS cube (
+        part TEXT, Date TEXT, Site TEXT, CATEGORIE TEXT, Desc_Cat TEXT, Desc_CA TEXT,
+        Montant INTEGER, Nombre INTEGER, Min INTEGER, Max INTEGER)''',
+    'CREATE INDEX IF NOT EXISTS consumption_date ON consumption (Date)',
+    'CREATE INDEX IF NOT EXISTS consumption_site ON consumption (Site, Date)',
+    'CREATE INDEX IF NOT EXISTS consumption_categorie ON consumption (CATEGORIE, Date)',
+    'CREATE INDEX IF NOT EXISTS consumption_equipment ON consumption (Desc_CA, Date)',
+    'CREATE INDEX IF NOT EXISTS consumption_type ON consumption (Desc_Cat, Date)',
+    'CREATE INDEX IF NOT EXISTS consumption_part ON consumption (part)',
+    'CREATE INDEX IF NOT EXISTS cube_date ON cube (Date)',
+    'CREATE INDEX IF NOT EXISTS cube_site ON cube (Site, Date)',
+    'CREATE INDEX IF NOT EXISTS cube_categorie ON cube (CATEGORIE, Date)',
+    'CREATE INDEX IF NOT EXISTS cube_equipment ON cube (Desc_CA, Date)',
+    'CREATE INDEX IF NOT EXISTS cube_type ON cube (Desc_Cat, Date)',
+    'CREATE INDEX IF NOT EXISTS cube_part ON cube (part)',
+] + [
+    statement
+    for grain in ROLLUP_GRAINS
+    for statement in (
+        f'''CREATE TABLE IF NOT EXISTS rollup_{grain} (
+            part TEXT, Date TEXT, Site TEXT, CATEGORIE TEXT, Desc_Cat TEXT, Desc_CA TEXT,
+            Montant INTEGER, Nombre INTEGER, Min INTEGER, Max INTEGER)''',
+        f'CREATE INDEX IF NOT EXISTS rollup_{grain}_date ON rollup_{grain} (Date)',
+        f'CREATE INDEX IF NOT EXISTS rollup_{grain}_site ON rollup_{grain} (Site, Date)',
+        f'CREATE INDEX IF NOT EXISTS rollup_{grain}_categorie ON rollup_{grain} (CATEGORIE, Date)',
+        f'CREATE INDEX IF NOT EXISTS rollup_{grain}_equipment ON rollup_{grain} (Desc_CA, Date)',
+        f'CREATE INDEX IF NOT EXISTS rollup_{grain}_part ON rollup_{grain} (part)',
+    )
+]
+
+def _create_schema(conn):
+    if conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Relire sous verrou : un autre processus a pu recréer la base entre-temps
+        if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            for table in TABLES:
+                conn.execute(f'DROP TABLE IF EXISTS {table}')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+# Connexions partagées par le processus, schéma créé une seule fois
+def connection(path=SQL_FILE):
+    return get_pool(path, _create_schema).connection()
+
+
+def _records(df, columns):
+    # Dates en texte ISO (ordre lexicographique = ordre chronologique), NA -> NULL
+    df = df[columns].astype({col: object for col in columns if col != 'Date'})
+    df['Date'] = df['Date'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df.where(df.notna(), None).itertuples(index=False, name=None)
+
+
+# Aligner la base sur les parties du magasin : les parties nouvelles sont recopiées,
+# celles qui ont été remplacées sont supprimées. Retourne le nombre de parties ajoutées.
+def sync_sql_store(store_dir, parts, path=SQL_FILE):
+    with connection(path) as conn:
+        return _sync(conn, store_dir, parts)
+
+
+# Cumuls d'une partie, calculés par SQLite depuis ses cellules du cube. Une période à
+# cheval sur plusieurs parties y a une ligne par partie : les lectures refont la somme
+# sur quelques centaines de lignes au lieu des millions de lignes brutes.
+def _rollup_part(conn, file):
+    for grain, period in ROLLUP_GRAINS.items():
+        conn.execute(
+            f'INSERT INTO rollup_{grain} '
+            f'SELECT part, {period} AS Periode, Site, CATEGORIE, Desc_Cat, Desc_CA, '
+            f'SUM(Montant), SUM(Nombre), MIN(Min), MAX(Max) FROM cube WHERE part = ? '
+            f'GROUP BY Periode, Site, CATEGORIE, Desc_Cat, Desc_CA',
+            (file,)
+        )
+
+
+# Parties copiées sans cumuls (bases créées avant leur introduction)
+def _unrolled_parts(conn):
+    sql = 'SELECT file FROM parts WHERE file NOT IN (SELECT DISTINCT part FROM rollup_year)'
+    return {row[0] for row in conn.execute(sql)}
+
+
+def _sync(conn, store_dir, parts):
+    wanted = {os.path.relpath(part, store_dir): part for part in parts}
+    known = {row[0] for row in conn.execute('SELECT file FROM parts')}
+    if known == set(wanted) and not _unrolled_parts(conn):
+        return 0
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Relire sous verrou : un autre processus a pu synchroniser entre-temps
+        known = {row[0] for row in conn.execute('SELECT file FROM parts')}
+        for file in known - set(wanted):
+            for table in TABLES:
+                key = 'file' if table == 'parts' else 'part'
+                conn.execute(f'DELETE FROM {table} WHERE {key} = ?', (file,))
+        for file in _unrolled_parts(conn):
+            _rollup_part(conn, file)
+        added = sorted(set(wanted) - known)
+        for file in added:
+            rows = pd.read_parquet(wanted[file], columns=ROW_COLUMNS)
+            conn.executemany(
+                f"INSERT INTO consumption (part, {', '.join(ROW_COLUMNS)}) VALUES ({', '.join('?' * (len(ROW_COLUMNS) + 1))})",
+                ((file, *row) for row in _records(rows, ROW_COLUMNS))
+            )
+            cube = read_cube_part(wanted[file])
+            cube_columns = CUBE_DIMENSIONS + MEASURE_COLUMNS
+            conn.executemany(
+                f"INSERT INTO cube (part, {', '.join(cube_columns)}) VALUES ({', '.join('?' * (len(cube_columns) + 1))})",
+                ((file, *row) for row in _records(cube, cube_columns))
+            )
+            _rollup_part(conn, file)
+            conn.execute('INSERT INTO parts VALUES (?)', (file,))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return len(added)
+
+
+# Traduire les filtres en clause WHERE paramétrée : période [start, end] par jour,
+# égalité pour une valeur, IN pour une liste de valeurs
+def where_clause(start=None, end=None, **columns):
+    conditions, params = [], []
+    if start is not None:
+        conditions.append('Date >= ?')
+        params.append(str(pd.Timestamp(start).date()))
+    if end is not None:
+        conditions.append('Date < ?')
+        params.append(str((pd.Timestamp(end) + pd.Timedelta(days=1)).date()))
+    for col, value in columns.items():
+        if col not in FILTER_COLUMNS:
+            raise ValueError(f"Colonne de filtre inconnue : {col}")
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(f"{col} IN ({', '.join('?' * len(value))})")
+            params.extend(value)
+        else:
+            conditions.append(f'{col} = ?')
+            params.append(value)
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+
+def _read_sql(conn, sql, params):
+    df = from_fixed(pd.read_sql_query(sql, conn, params=params))
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date'])
+    return df
+
+
+# Agrégats du cube journalier regroupés par `keys`, calculés par SQLite
+def aggregate(conn, keys=(), start=None, end=None, **columns):
+    if not set(keys) <= set(CUBE_DIMENSIONS):
+        raise ValueError(f"Dimension inconnue : {keys}")
+    where, params = where_clause(start, end, **columns)
+    group = f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}" if keys else ''
+    select = ''.join(f'{key}, ' for key in keys)
+    sql = (
+        f'SELECT {select}SUM(Montant) AS Montant, SUM(Nombre) AS Nombre, '
+        f'MIN(Min) AS Min, MAX(Max) AS Max FROM cube{where}{group}'
+    )
+    df = _read_sql(conn, sql, params)
+    if not keys and df['Nombre'].isna().all():
+        # Aucune ligne filtrée : pas de total, comme un groupby vide
+        return df.iloc[:0]
+    return df
+
+
+def _period_start(grain, day):
+    day = pd.Timestamp(day).normalize()
+    if grain == 'week':
+        return day - pd.Timedelta(days=day.dayofweek)
+    if grain == 'month':
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def _next_period(grain, start):
+    if grain == 'week':
+        return start + pd.Timedelta(days=7)
+    return start + (pd.DateOffset(months=1) if grain == 'month' else pd.DateOffset(years=1))
+
+
+# Agrégats par période (`grain` : day, week, month ou year) et par `keys`, avec 'Date' =
+# début de période. Les périodes entièrement couvertes par [start, end] sont lues dans la
+# table de cumuls ; seules les périodes entamées aux bords sont recalculées depuis le cube.
+# Les deux morceaux sont sommés dans la même requête (montants exacts en centimes).
+def rollup(conn, grain, keys=(), start=None, end=None, **columns):
+    if grain not in GRAINS:
+        raise ValueError(f"Granularité inconnue : {grain}")
+    if not set(keys) <= set(FILTER_COLUMNS):
+        raise ValueError(f"Dimension inconnue : {keys}")
+    if grain == 'day':
+        return aggregate(conn, ('Date',) + tuple(keys), start, end, **columns)
+
+    # Périodes complètes : de la première période commençant après `start` à la
+    # dernière finissant avant `end`
+    body_start = None if start is None else _period_start(grain, start)
+    if body_start is not None and body_start < pd.Timestamp(start).normalize():
+        body_start = _next_period(grain, body_start)
+    body_end = None if end is None else _period_start(grain, pd.Timestamp(end) + pd.Timedelta(days=1))
+    if body_start is not None and body_end is not None and body_start >= body_end:
+        ranges = [('cube', ROLLUP_GRAINS[grain], start, end)]
+    else:
+        last_period = None if body_end is None else body_end - pd.Timedelta(days=1)
+        ranges = [(f'rollup_{grain}', 'Date', body_start, last_period)]
+        if body_start is not None and pd.Timestamp(start) < body_start:
+            ranges.append(('cube', ROLLUP_GRAINS[grain], start, body_start - pd.Timedelta(days=1)))
+        if body_end is not None and body_end <= pd.Timestamp(end):
+            ranges.append(('cube', ROLLUP_GRAINS[grain], body_end, end))
+
+    select = ''.join(f', {key}' for key in keys)
+    parts, params = [], []
+    for table, period, range_start, range_end in ranges:
+        where, where_params = where_clause(range_start, range_end, **columns)
+        parts.append(f'SELECT {period} AS Periode{select}, Montant, Nombre, Min, Max FROM {table}{where}')
+        params.extend(where_params)
+    group = ', '.join(('Periode',) + tuple(keys))
+    sql = (
+        f'SELECT Periode AS Date{select}, SUM(Montant) AS Montant, SUM(Nombre) AS Nombre, '
+        f'MIN(Min) AS Min, MAX(Max) AS Max FROM ({" UNION ALL ".join(parts)}) '
+        f'GROUP BY {group} ORDER BY {group}'
+    )
+    return _read_sql(conn, sql, params)
+
+
+# Premier et dernier jour présents dans la base
+def date_bounds(conn):
+    first, last = conn.execute('SELECT MIN(Date), MAX(Date) FROM cube').fetchone()
+    if first is None:
+        return None, None
+    return pd.Timestamp(first), pd.Timestamp(last)
+
+
+# Valeurs distinctes d'une colonne, éventuellement sous des filtres (ex. Site=[...])
+def distinct_values(conn, col, **columns):
+    if col not in FILTER_COLUMNS:
+        raise ValueError(f"Colonne de filtre inconnue : {col}")
+    where, params = where_clause(**columns)
+    return [row[0] for row in conn.execute(f'SELECT DISTINCT {col} FROM cube{where} ORDER BY {col}', params)]
+
+
+def count_rows(conn, start=None, end=None, **columns):
+    where, params = where_clause(start, end, **columns)
+    return conn.execute(f'SELECT COUNT(*) FROM consumption{where}', params).fetchone()[0]
+
+
+# Une page de lignes brutes triée par `order_by` ; à égalité l'ordre chronologique est conservé
+def fetch_rows(conn, columns, order_by='Date', descending=False, limit=100, offset=0,
+               start=None, end=None, **filters):
+    if order_by not in ROW_COLUMNS or not set(columns) <= set(ROW_COLUMNS):
+        raise ValueError(f"Colonne inconnue : {order_by}")
+    where, params = where_clause(start, end, **filters)
+    direction = 'DESC' if descending else 'ASC'
+    sql = (
+        f"SELECT {', '.join(columns)} FROM consumption{where} "
+        f"ORDER BY {order_by} {direction}, Date, rowid LIMIT ? OFFSET ?"
+    )
+    return _read_sql(conn, sql, params + [int(limit), int(offset)])
+
+
+# Moteur d'agrégation dont les passages sont poussés vers SQLite : seuls les
+# agrégats filtrés arrivent dans pandas, les regroupements dérivés restent en mémoire.
+# Avec un SharedCache, chaque passage est partagé entre les processus de la machine.
+class SqlAggregator(Aggregator):
+    def __init__(self, path=SQL_FILE, base_keys=BASE_KEYS, start=None, end=None, cache=None, **columns):
+        super().__init__(None, base_keys)
+        self.path = path
+        self.cache = cache
+        # Filtres normalisés (toutes les colonnes, bornes au jour) : la clé de cache partagée
+        # ne dépend ni des colonnes omises ni du type des dates passées par l'appelant
+        unknown = sorted(set(columns) - set(FILTER_COLUMNS))
+        if unknown:
+            raise ValueError(f"Colonne de filtre inconnue : {', '.join(unknown)}")
+        self.filters = {col: columns.get(col) for col in FILTER_COLUMNS}
+        self.filters.update(
+            start=None if start is None else pd.Timestamp(start).date(),
+            end=None if end is None else pd.Timestamp(end).date(),
+        )
+
+    def _query(self, keys, columns):
+        with connection(self.path) as conn:
+            return aggregate(conn, keys, **columns)
+
+    def _columns(self, where):
+        columns = dict(self.filters)
+        for col, value in where.items():
+            # Une restriction contraire au filtre ne retient aucune ligne (IN vide)
+            columns[col] = value if columns.get(col) in (None, value) else []
+        return columns
+
+    def _cached(self, name, args, compute):
+        if self.cache is None:
+            return compute()
+        return self.cache.get_or_compute(name, args, compute)
+
+    def _scan(self, keys, where):
+        self.scans += 1
+        columns = self._columns(where)
+        return self._cached(
+            'aggregate', (tuple(keys), sorted(columns.items())), lambda: self._query(keys, columns)
+        )
+
+    # Série par période (day, week, month, year) regroupée par `keys`, lue dans les cumuls
+    def timeline(self, grain, *keys, **where):
+        self.scans += 1
+        columns = self._columns(where)
+
+        def query():
+            with connection(self.path) as conn:
+                return rollup(conn, grain, keys, **columns)
+        return self._cached('rollup', (grain, tuple(keys), sorted(columns.items())), query)
+
+    # Nombre de lignes brutes sous les filtres, restreint par `where` (ex. Desc_Cat=[...])
+    def row_count(self, **where):
+        columns = self._columns(where)
+
+        def query():
+            with connection(self.path) as conn:
+                return count_rows(conn, **columns)
+        return self._cached('count_rows', sorted(columns.items()), query)
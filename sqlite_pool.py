@@ -0,0 +1,59 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Réglages communs : WAL (lecteurs et écrivain ne se bloquent pas) et attente sur
+# verrou plutôt qu'une erreur "database is locked" immédiate
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=30000',
+]
+
+_pools = {}
+_lock = threading.Lock()
+
+
+# Pool de connexions partagé par les threads du processus (Streamlit exécute chaque
+# rerun dans un nouveau thread) : les connexions sont réutilisées, pas rouvertes
+class ConnectionPool:
+    def __init__(self, path, size=8):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+
+# Pool unique par base ; `setup(conn)` (schéma, migrations) ne s'exécute qu'à sa création
+def get_pool(path, setup=None):
+    path = os.path.abspath(path)
+    with _lock:
+        if path not in _pools:
+            pool = ConnectionPool(path)
+            if setup is not None:
+                with pool.connection() as conn:
+                    setup(conn)
+            _pools[path] = pool
+        return _pools[path]
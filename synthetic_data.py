@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+# Parc fictif aux cardinalités d'un site réel : quelques types d'engins,
+# quelques centaines d'équipements, une poignée de types de consommation
+CATEGORIES = ['CHARGEUSE', 'CAMION', 'FOREUSE', 'BOULONNEUSE', 'NIVELEUSE', 'PELLE', 'COMPACTEUR', 'DUMPER']
+MODELS = ['CAT', 'CATERPILLARD', 'SANDVIK', 'EPIROC', 'KOMATSU']
+CONSUMPTION_TYPES = [
+    'GASOIL', 'PNEUMATIQUES', 'LUBRIFIANTS', 'FILTRES', 'PIECES DE RECHANGE',
+    'FLEXIBLES', 'BATTERIES', 'GRAISSE'
+]
+EQUIPMENT_PER_CATEGORY = 40
+LOADERS = 60
+MOIS = [
+    'JANVIER', 'FÉVRIER', 'MARS', 'AVRIL', 'MAI', 'JUIN',
+    'JUILLET', 'AOÛT', 'SEPTEMBRE', 'OCTOBRE', 'NOVEMBRE', 'DÉCEMBRE'
+]
+
+# Une feuille Excel est limitée à 1 048 576 lignes : au-delà on écrit plusieurs classeurs
+MAX_ROWS_PER_WORKBOOK = 1_000_000
+
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+FIRST_DAY = pd.Timestamp('2021-01-01')
+DAYS = 4 * 365
+
+
+def parse_size(text):
+    text = str(text).strip().lower()
+    factor = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * factor)
+
+
+# Libellés sales comme dans les exports : signe "numéro" pleine chasse (Nｰ),
+# coquille CATERPILLARD, espaces multiples ou en bordure
+def _dirty(labels, rng):
+    labels = np.asarray(labels, dtype=object).copy()
+    n = len(labels)
+    fullwidth = rng.random(n) < 0.15
+    labels[fullwidth] = [label.replace('N°', 'Nｰ') for label in labels[fullwidth]]
+    padded = rng.random(n) < 0.1
+    labels[padded] = [f"  {label} " for label in labels[padded]]
+    doubled = rng.random(n) < 0.05
+    labels[doubled] = [label.replace(' ', '  ', 1) for label in labels[doubled]]
+    return labels
+
+
+def _dates(n, rng):
+    # Plus d'activité en semaine qu'en week-end
+    days = FIRST_DAY + pd.to_timedelta(rng.integers(0, DAYS, n), unit='D')
+    weekend = days.dayofweek >= 5
+    shift = np.where(weekend & (rng.random(n) < 0.6), -2, 0)
+    return days + pd.to_timedelta(shift, unit='D')
+
+
+def _amounts(n, rng):
+    # Montants à queue lourde : beaucoup de petites consommations, quelques grosses pièces
+    return np.round(rng.lognormal(6.0, 1.1, n), 2)
+
+
+# Lignes au schéma de engins2.xlsx (Date, CATEGORIE, Desc_Cat, Desc_CA, Montant)
+def generate_consumption(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    fleet = [
+        (cat, f"{cat} {MODELS[i % len(MODELS)]} N°{i + 1}")
+        for cat in CATEGORIES for i in range(EQUIPMENT_PER_CATEGORY)
+    ]
+    # Quelques équipements concentrent l'essentiel de l'activité (loi de Zipf)
+    weights = 1 / np.arange(1, len(fleet) + 1) ** 0.8
+    picks = rng.choice(len(fleet), n_rows, p=weights / weights.sum())
+    categories = np.array([cat for cat, _ in fleet], dtype=object)[picks]
+    equipment = np.array([name for _, name in fleet], dtype=object)[picks]
+    types = np.array(CONSUMPTION_TYPES, dtype=object)[rng.integers(0, len(CONSUMPTION_TYPES), n_rows)]
+    return pd.DataFrame({
+        'Date': _dates(n_rows, rng),
+        'CATEGORIE': categories,
+        'Desc_Cat': _dirty(types, rng),
+        'Desc_CA': _dirty(equipment, rng),
+        'Montant': _amounts(n_rows, rng),
+    })
+
+
+# Lignes au schéma de engins.xlsx (Date, MOIS, Desc_CA, Desc_Cat, Montant) avec les
+# défauts rencontrés : dates en numéro de série ou en texte, mois en minuscules,
+# engins sans numéro, montants non numériques
+def generate_engins(n_rows, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    dates = _dates(n_rows, rng)
+    serials = np.asarray((dates - EXCEL_EPOCH).days, dtype=object)
+    as_text = rng.random(n_rows) < 0.15
+    serials[as_text] = dates[as_text].strftime('%Y-%m-%d')
+    mois = np.array(MOIS, dtype=object)[dates.month - 1]
+    lower = rng.random(n_rows) < 0.3
+    mois[lower] = [f" {month.lower()}" for month in mois[lower]]
+    mois[rng.random(n_rows) < 0.01] = None
+    loaders = np.array(
+        [f"CHARGEUSE R1600 N°{i + 1}" for i in range(LOADERS)] + ['CHARGEUSE SANS NUMERO'], dtype=object
+    )
+    amounts = _amounts(n_rows, rng).astype(object)
+    amounts[rng.random(n_rows) < 0.002] = 'N/A'
+    types = np.array(CONSUMPTION_TYPES, dtype=object)[rng.integers(0, len(CONSUMPTION_TYPES), n_rows)]
+    return pd.DataFrame({
+        'Date': serials,
+        'MOIS': mois,
+        'Desc_CA': _dirty(loaders[rng.integers(0, len(loaders), n_rows)], rng),
+        'Desc_Cat': types,
+        'Montant': amounts,
+    })
+
+
+# Écriture en flux (openpyxl write_only) : mémoire constante, bien plus rapide que to_excel
+def write_workbook(df, path):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(df.columns))
+    columns = [col.astype(object).to_numpy() for _, col in df.items()]
+    for row in zip(*columns):
+        sheet.append([None if value is None or value != value else value for value in row])
+    tmp_path = f"{path}.tmp"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Générer le jeu d'essai d'une taille dans `directory` (réutilisé s'il existe déjà) :
+# engins2.xlsx, puis engins2_NN.xlsx au-delà d'un million de lignes, et engins.xlsx
+# (plafonné à une feuille). Retourne la liste des classeurs de consommation.
+def write_dataset(directory, n_rows, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, 'dataset.json')
+    meta = {'rows': n_rows, 'seed': seed}
+    chunks = -(-n_rows // MAX_ROWS_PER_WORKBOOK)
+    names = ['engins2.xlsx'] + [f"engins2_{i:02d}.xlsx" for i in range(1, chunks)]
+    workbooks = [os.path.join(directory, name) for name in names]
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            if json.load(f) == meta:
+                return workbooks
+    except (OSError, ValueError):
+        pass
+
+    for i, path in enumerate(workbooks):
+        rows = min(MAX_ROWS_PER_WORKBOOK, n_rows - i * MAX_ROWS_PER_WORKBOOK)
+        write_workbook(generate_consumption(rows, seed + i), path)
+    write_workbook(generate_engins(min(n_rows, MAX_ROWS_PER_WORKBOOK), seed), os.path.join(directory, 'engins.xlsx'))
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return workbooks
+
+
+#   python synthetic_data.py 100k bench_data/100k
+def main():
+    parser = argparse.ArgumentParser(description="Classeurs synthétiques au schéma de engins2.xlsx et engins.xlsx")
+    parser.add_argument('size', help="Nombre de lignes (10k, 100k, 1M, 10M...)")
+    parser.add_argument('directory')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for path in write_dataset(args.directory, parse_size(args.size), args.seed):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
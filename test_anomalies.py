@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomalies import AnomalyDetector
+from sql_store import connection
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'engins.sqlite')
+
+
+# Ajouter une partie au cube : une dépense par équipement et par semaine à partir de `first_day`
+def add_part(path, file, first_day, weeks, seed):
+    rng = np.random.default_rng(seed)
+    rows = [
+        (file, f"{day:%Y-%m-%d} 00:00:00", 'jorf', 'CAMION', 'GASOIL', f"CAMION N°{unit}",
+         int(rng.integers(1000, 5000)) * 100, 1, 0, 0)
+        for day in pd.date_range(first_day, periods=weeks, freq='7D')
+        for unit in range(4)
+    ]
+    with connection(path) as conn:
+        conn.execute('INSERT INTO parts (file) VALUES (?)', (file,))
+        conn.executemany(
+            'INSERT INTO cube (part, Date, Site, CATEGORIE, Desc_Cat, Desc_CA, Montant, Nombre, Min, Max) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows
+        )
+
+
+def assert_same_scores(a, b):
+    order = b.index.get_indexer(a.index)
+    assert (order >= 0).all() and len(order) == len(b.index)
+    assert a.first_week == b.first_week
+    for name in ('values', 'z_history', 'jump', 'z_peers'):
+        np.testing.assert_allclose(getattr(a, name), getattr(b, name)[order], equal_nan=True)
+
+
+def test_incremental_refresh_matches_full(db):
+    add_part(db, 'a', '2024-01-01', 30, seed=1)
+    detector = AnomalyDetector(db)
+    detector.refresh()
+    add_part(db, 'b', '2024-07-29', 8, seed=2)
+    assert detector.refresh() == 8
+    full = AnomalyDetector(db)
+    full.refresh()
+    assert_same_scores(detector.scores, full.scores)
+
+
+# Nouvelle partie après plusieurs semaines sans données : la mise à jour couvre le trou
+def test_incremental_refresh_after_gap(db):
+    add_part(db, 'a', '2024-01-01', 30, seed=1)
+    detector = AnomalyDetector(db)
+    detector.refresh()
+    add_part(db, 'b', '2024-09-02', 8, seed=2)
+    assert detector.refresh() == 8 + 5
+    assert detector.parts == {'a', 'b'}
+    assert detector.refresh() == 0
+    full = AnomalyDetector(db)
+    full.refresh()
+    assert_same_scores(detector.scores, full.scores)
+    detector.flagged(start=pd.Timestamp('2024-09-02'))
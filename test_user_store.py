@@ -0,0 +1,78 @@
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from user_store import add_user, check_login, close_session, open_session, session_user
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / 'users.db')
+
+
+# Inscriptions et connexions simultanées sur une base locale, sans erreur de verrou
+def test_concurrent_logins(db):
+    users, logins = 50, 500
+    with ThreadPoolExecutor(64) as pool:
+        list(pool.map(lambda i: add_user(f"user{i}", f"pw{i}", db), range(users)))
+
+    def login(i):
+        user = f"user{i % users}"
+        # Un essai sur quatre avec un mauvais mot de passe
+        password = f"pw{i % users}" if i % 4 else "wrong"
+        if not check_login(user, password, db):
+            return None
+        return session_user(open_session(user, path=db), db)
+
+    with ThreadPoolExecutor(64) as pool:
+        results = list(pool.map(login, range(logins)))
+    assert results == [f"user{i % users}" if i % 4 else None for i in range(logins)]
+
+
+def test_duplicate_user_rejected(db):
+    add_user('alice', 'pw', db)
+    with pytest.raises(sqlite3.IntegrityError):
+        add_user('alice', 'other', db)
+    assert check_login('alice', 'pw', db)
+    assert not check_login('alice', 'other', db)
+
+
+def test_session_revoked_on_close(db):
+    add_user('alice', 'pw', db)
+    token = open_session('alice', path=db)
+    other = open_session('alice', path=db)
+    assert session_user(token, db) == 'alice'
+    close_session(token, db)
+    assert session_user(token, db) is None
+    # Les autres sessions de l'utilisateur restent ouvertes
+    assert session_user(other, db) == 'alice'
+
+
+def test_session_rejected_when_expired_unknown_or_user_deleted(db):
+    add_user('alice', 'pw', db)
+    assert session_user(open_session('alice', ttl=-1, path=db), db) is None
+    assert session_user('forged', db) is None
+    assert session_user(None, db) is None
+
+    token = open_session('alice', path=db)
+    with sqlite3.connect(db) as conn:
+        conn.execute("DELETE FROM users WHERE username = 'alice'")
+    assert session_user(token, db) is None
+
+
+def test_token_not_stored_in_clear(db):
+    add_user('alice', 'pw', db)
+    token = open_session('alice', path=db)
+    with sqlite3.connect(db) as conn:
+        stored = [row[0] for row in conn.execute('SELECT token FROM sessions')]
+    assert token not in stored and len(stored) == 1
+
+
+def test_expired_sessions_purged(db):
+    add_user('alice', 'pw', db)
+    open_session('alice', ttl=-10, path=db)
+    open_session('alice', path=db)
+    with sqlite3.connect(db) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM sessions WHERE expires < ?', (time.time(),)).fetchone()[0] == 0
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Instrumentation des reruns, activée avec ENGINS_PROFILE=1 : désactivée, chaque
+# section ne coûte qu'un appel de fonction (span partagé qui ne fait rien)
+ENABLED = os.environ.get('ENGINS_PROFILE', '0') == '1'
+LOG_FILE = os.environ.get('ENGINS_PROFILE_LOG', 'engins_timings.jsonl')
+
+# Utilisateurs autorisés à voir le panneau des durées (séparés par des virgules)
+ADMINS = {name.strip() for name in os.environ.get('ENGINS_ADMINS', '').split(',') if name.strip()}
+# Applications sans connexion (engins_test) : personne ne peut y être reconnu comme
+# administrateur, le panneau n'y est affiché que sur demande explicite (ENGINS_PROFILE_PANEL=1)
+PUBLIC_PANEL = os.environ.get('ENGINS_PROFILE_PANEL', '0') == '1'
+
+# Derniers reruns du processus, toutes sessions confondues, pour le panneau d'administration
+HISTORY_SIZE = 50
+history = deque(maxlen=HISTORY_SIZE)
+
+_log_lock = threading.Lock()
+
+
+# Taille sérialisée approximative de ce qui part vers le navigateur
+def payload_bytes(obj):
+    if hasattr(obj, 'to_plotly_json'):
+        return len(obj.to_json())
+    if hasattr(obj, 'data') and hasattr(obj, 'to_html'):
+        # Styler : les données passent en Arrow, le style en plus
+        obj = obj.data
+    if hasattr(obj, 'memory_usage'):
+        try:
+            import pyarrow as pa
+            return pa.Table.from_pandas(obj).nbytes
+        except (ImportError, ValueError, TypeError):
+            return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, str):
+        return len(obj.encode())
+    return 0
+
+
+class Span:
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+        self.rows = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.timings._open.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        self.timings._open.remove(self)
+        return False
+
+    def record(self):
+        return {'name': self.name, 'ms': round(self.seconds * 1000, 2), 'rows': self.rows, 'bytes': self.bytes}
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+# Durées nommées d'un rerun ; `finish()` écrit une ligne JSON dans le journal
+# et garde le rerun dans l'historique du processus
+class Timings:
+    def __init__(self, app, user='', enabled=ENABLED, log_file=LOG_FILE):
+        self.app = app
+        self.user = user
+        self.enabled = enabled
+        self.log_file = log_file
+        self.spans = []
+        self.finished = False
+        self._open = []
+        self._start = time.perf_counter()
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        span = Span(self, name)
+        self.spans.append(span)
+        return span
+
+    # Lignes traitées, attribuées aux sections ouvertes (une section englobante les cumule)
+    def count(self, rows):
+        for span in self._open:
+            span.rows += int(rows)
+
+    # Ajouter la taille sérialisée d'un objet affiché (figure, frame, Styler, HTML) aux
+    # sections ouvertes ; retourne l'objet pour s'utiliser en ligne : st.plotly_chart(timings.measure(fig))
+    def measure(self, obj):
+        if self._open:
+            size = payload_bytes(obj)
+            for span in self._open:
+                span.bytes += size
+        return obj
+
+    # Section d'un fragment Streamlit : pendant le rerun complet elle s'ajoute au rerun en
+    # cours ; lors d'un rerun partiel (le rerun complet est déjà terminé), le fragment est
+    # journalisé comme un rerun à part. Utiliser l'objet retourné dans le fragment.
+    @contextmanager
+    def fragment(self, name):
+        if not self.finished:
+            with self.span(name):
+                yield self
+            return
+        timings = Timings(self.app, self.user, self.enabled, self.log_file)
+        try:
+            with timings.span(name):
+                yield timings
+        finally:
+            timings.finish()
+
+    def finish(self):
+        self.finished = True
+        if not self.enabled:
+            return None
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'app': self.app,
+            'user': self.user,
+            'total_ms': round((time.perf_counter() - self._start) * 1000, 2),
+            'spans': [span.record() for span in self.spans],
+        }
+        history.append(record)
+        if self.log_file:
+            line = json.dumps(record, ensure_ascii=False)
+            with _log_lock, open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        return record
+
+
+# Une ligne par rerun récent de `app` (le plus récent en premier), une colonne de ms par section
+def history_frame(app, limit=HISTORY_SIZE):
+    import pandas as pd
+
+    rows = []
+    for record in reversed([record for record in list(history) if record['app'] == app][-limit:]):
+        row = {'Heure': record['time'][11:], 'Utilisateur': record['user'], 'Total (ms)': record['total_ms']}
+        for span in record['spans']:
+            row[span['name']] = row.get(span['name'], 0) + span['ms']
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# Détail (lignes, octets) des sections du dernier rerun de `app`
+def last_rerun_frame(app):
+    import pandas as pd
+
+    records = [record for record in list(history) if record['app'] == app]
+    if not records:
+        return pd.DataFrame()
+    return pd.DataFrame(records[-1]['spans']).rename(columns={
+        'name': 'Section', 'ms': 'Durée (ms)', 'rows': 'Lignes', 'bytes': 'Octets envoyés'
+    })
@@ -0,0 +1,105 @@
+import hashlib
+import hmac
+import secrets
+import time
+
+from sqlite_pool import get_pool
+
+DB_FILE = 'users.db'
+
+# Durée de validité d'une session (secondes) : une journée de poste
+SESSION_TTL = 8 * 3600
+
+# Migrations du schéma, appliquées une seule fois (PRAGMA user_version)
+MIGRATIONS = [
+    'CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT)',
+    'CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)',
+    # Jetons signés remplacés par des sessions révocables : le secret de signature n'a plus d'usage
+    'DROP TABLE IF EXISTS settings',
+    'CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, username TEXT NOT NULL, expires INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)',
+]
+
+
+def make_hashes(password):
+    return hashlib.sha256(str.encode(password)).hexdigest()
+
+
+def _migrate(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Relire sous verrou : un autre processus a pu migrer entre-temps
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for statement in MIGRATIONS[version:]:
+            conn.execute(statement)
+        conn.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+# Connexions réutilisées par tout le processus ; la migration du schéma
+# n'est faite qu'une fois, à la création du pool
+def _connection(path):
+    return get_pool(path, _migrate).connection()
+
+
+def add_user(username, password, path=DB_FILE):
+    with _connection(path) as conn:
+        conn.execute(
+            'INSERT INTO users (username, password) VALUES (?, ?)', (username, make_hashes(password))
+        )
+
+
+# Recherche par clé primaire, puis comparaison du hash à temps constant
+def check_login(username, password, path=DB_FILE):
+    with _connection(path) as conn:
+        row = conn.execute('SELECT password FROM users WHERE username = ?', (username,)).fetchone()
+    return row is not None and hmac.compare_digest(row[0], make_hashes(password))
+
+
+# Sessions côté serveur : le navigateur ne détient qu'un identifiant aléatoire, la base
+# n'en garde que l'empreinte. Une session se révoque en supprimant sa ligne (déconnexion),
+# et disparaît avec son utilisateur.
+def _digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# Nouvelle session pour `username` ; retourne l'identifiant à remettre au navigateur
+def open_session(username, ttl=SESSION_TTL, path=DB_FILE):
+    token = secrets.token_urlsafe(32)
+    now = int(time.time())
+    with _connection(path) as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        # Purge des sessions expirées au passage
+        conn.execute('DELETE FROM sessions WHERE expires < ?', (now,))
+        conn.execute(
+            'INSERT INTO sessions (token, username, expires) VALUES (?, ?, ?)',
+            (_digest(token), username, now + ttl)
+        )
+        conn.execute('COMMIT')
+    return token
+
+
+# Utilisateur d'une session ouverte, non expirée et dont l'utilisateur existe encore, sinon None
+def session_user(token, path=DB_FILE):
+    if not token:
+        return None
+    with _connection(path) as conn:
+        row = conn.execute(
+            'SELECT s.username FROM sessions s JOIN users u ON u.username = s.username '
+            'WHERE s.token = ? AND s.expires >= ?',
+            (_digest(token), int(time.time()))
+        ).fetchone()
+    return row[0] if row else None
+
+
+def close_session(token, path=DB_FILE):
+    if not token:
+        return
+    with _connection(path) as conn:
+        conn.execute('DELETE FROM sessions WHERE token = ?', (_digest(token),))
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+
+from anomalies import get_detector
+from data_store import DATA_SOURCE, ingest_workbooks, store_parts
+from shared_cache import SharedCache, dataset_fingerprint
+from sql_store import SqlAggregator, connection, date_bounds, sync_sql_store
+
+# Préchauffage au démarrage du serveur : désactivable avec ENGINS_WARMUP=0
+WARMUP_ENABLED = os.environ.get('ENGINS_WARMUP', '1') != '0'
+
+
+# Préchargement en arrière-plan pendant que la page de connexion est affichée :
+# ingestion, copie SQLite et agrégats de l'état de filtres par défaut, pour que le
+# premier affichage après connexion soit aussi rapide qu'un affichage à chaud.
+# `timings` garde la durée de chaque étape du démarrage à froid (secondes).
+class WarmUp:
+    def __init__(self, data_source, store_dir, sql_file, cache_file, clean, columns=None):
+        self.data_source = data_source
+        self.store_dir = store_dir
+        self.sql_file = sql_file
+        self.cache_file = cache_file
+        self.clean = clean
+        self.columns = columns
+        self.timings = {}
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name='engins-warmup', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    # Attendre la fin du préchauffage (appelé avant le premier affichage du tableau de bord)
+    def wait(self, timeout=None):
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _step(self, name, func):
+        start = time.perf_counter()
+        result = func()
+        self.timings[name] = time.perf_counter() - start
+        return result
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            # Bibliothèques de graphiques importées hors du chemin critique
+            self._step('import plotly', lambda: __import__('plotly.express'))
+            self._step('ingestion Excel', lambda: ingest_workbooks(self.store_dir, self.data_source, self.clean, columns=self.columns))
+            parts = store_parts(self.store_dir)
+            self._step('copie SQLite', lambda: sync_sql_store(self.store_dir, parts, self.sql_file))
+            self._step('agrégats par défaut', lambda: self._pre_aggregate(parts))
+            # Scores d'anomalies de la flotte, gardés en mémoire par le processus
+            self._step('anomalies', lambda: get_detector(self.sql_file).refresh())
+        except Exception as exc:
+            # Le tableau de bord refera le travail lui-même et affichera l'erreur éventuelle
+            self.error = exc
+        self.timings['total'] = time.perf_counter() - started
+
+    # Mêmes requêtes que le premier affichage : période complète, tous les équipements
+    def _pre_aggregate(self, parts):
+        with connection(self.sql_file) as conn:
+            first_day, last_day = date_bounds(conn)
+        if first_day is None:
+            return
+        cache = SharedCache(self.cache_file, dataset_fingerprint(parts))
+        agg = SqlAggregator(
+            self.sql_file, start=first_day.date(), end=last_day.date(), cache=cache, Desc_CA=None, Site=None
+        )
+        agg.by(*agg.base_keys)
+        agg.row_count(Desc_Cat=None)
+
+
+# Préchauffage synchrone, à lancer par le script de déploiement avant `streamlit run` :
+#   python warmup.py
+def main():
+    from cleaning import CONSUMPTION_COLUMNS, clean_consumption
+
+    warmup = WarmUp(
+        DATA_SOURCE, 'engins2.store', 'engins2.sqlite', 'engins2.cache.sqlite', clean_consumption, CONSUMPTION_COLUMNS
+    )
+    warmup.start().wait()
+    for step, seconds in warmup.timings.items():
+        print(f"{step:<22} {seconds:7.3f} s")
+    if warmup.error is not None:
+        raise warmup.error
+
+
+if __name__ == '__main__':
+    main()
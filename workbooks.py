@@ -0,0 +1,174 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from data_model import concat_compact
+from excel_stream import read_excel_chunks
+from quality import merge_reports
+
+# Chaque site exporte ses propres classeurs. Une source de données est un classeur, un
+# répertoire (tous ses .xlsx, sous-répertoires compris) ou un motif glob, séparés par des
+# virgules s'il y en a plusieurs. Un suffixe '#Feuille' choisit une feuille, '#*' toutes
+# les feuilles ; la première feuille est lue sinon.
+#   engins2.xlsx    sites/    sites/*/engins*.xlsx    export.xlsx#Juin,export.xlsx#Juillet
+SHEET_SEPARATOR = '#'
+ALL_SHEETS = '*'
+
+
+# Un classeur (ou une feuille) à lire, avec son site et son libellé de source
+@dataclass
+class WorkbookSpec:
+    path: str
+    sheet: str = None
+    site: str = ''
+    source: str = ''
+
+    # Clé stable pour le manifeste du magasin et les caches
+    @property
+    def key(self):
+        key = os.path.abspath(self.path)
+        return key if self.sheet is None else f"{key}{SHEET_SEPARATOR}{self.sheet}"
+
+
+def _base_dir(pattern):
+    # Partie du motif sans joker : le site se lit dans le premier répertoire qui suit
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or '.'
+
+
+# Site d'un classeur : le premier répertoire sous la racine de la source (sites/ ->
+# sites/jorf/engins.xlsx -> jorf), sinon le répertoire qui le contient. Les exports
+# successifs d'un même répertoire appartiennent ainsi au même site.
+def site_of(path, root):
+    relative = os.path.relpath(path, root)
+    head = relative.split(os.sep)[0]
+    if head != relative:
+        return head
+    return os.path.basename(os.path.abspath(root))
+
+
+def _is_workbook(path):
+    name = os.path.basename(path)
+    # '~$classeur.xlsx' : fichier de verrou d'Excel pendant l'édition
+    return name.lower().endswith(('.xlsx', '.xlsm')) and not name.startswith('~$')
+
+
+def _expand(item):
+    path, _, sheet = item.partition(SHEET_SEPARATOR)
+    path = path.strip()
+    if os.path.isdir(path):
+        root = path
+        paths = glob.glob(os.path.join(path, '**', '*'), recursive=True)
+    elif glob.has_magic(path):
+        root = _base_dir(path)
+        paths = glob.glob(path, recursive=True)
+    else:
+        # Classeur nommé explicitement : gardé tel quel, une absence sera rapportée à la lecture
+        return [(path, sheet.strip() or None, os.path.dirname(path) or '.')]
+    paths = sorted(p for p in paths if _is_workbook(p) and os.path.isfile(p))
+    return [(p, sheet.strip() or None, root) for p in paths]
+
+
+# Classeurs (et feuilles) d'une source ; '#*' est développé en une entrée par feuille.
+# Un classeur atteint par plusieurs entrées n'est gardé qu'une fois ; les libellés restent
+# uniques (voir _unique_sources).
+def find_workbooks(source):
+    items = source if isinstance(source, (list, tuple)) else str(source).split(',')
+    specs, seen = [], set()
+    for item in items:
+        for path, sheet, root in _expand(item):
+            site = site_of(path, root)
+            relative = os.path.relpath(path, root)
+            sheets = [sheet]
+            if sheet == ALL_SHEETS:
+                try:
+                    sheets = pd.ExcelFile(path).sheet_names
+                except Exception:
+                    # Classeur illisible : l'erreur sera rapportée à la lecture
+                    sheets = [None]
+            for name in sheets:
+                label = relative if name is None else f"{relative}{SHEET_SEPARATOR}{name}"
+                spec = WorkbookSpec(path, name, site, label)
+                if spec.key not in seen:
+                    seen.add(spec.key)
+                    specs.append(spec)
+    return _unique_sources(specs)
+
+
+# Libellés relatifs à la racine de chaque entrée : a/engins.xlsx,b/engins.xlsx donnent deux
+# fois 'engins.xlsx'. Les doublons sont préfixés de leur site, puis remplacés par le chemin
+# complet s'ils se confondent encore.
+def _unique_sources(specs):
+    for label in (lambda spec: f"{spec.site}/{spec.source}", lambda spec: spec.key):
+        counts = {}
+        for spec in specs:
+            counts[spec.source] = counts.get(spec.source, 0) + 1
+        for spec in specs:
+            if counts[spec.source] > 1:
+                spec.source = label(spec)
+    return specs
+
+
+# Lire une feuille en flux, ne garder que `columns`, puis nettoyer et étiqueter chaque bloc.
+# `clean` retourne une frame, ou un tuple (frame, QualityReport) comme clean_engins.
+def iter_workbook(spec, clean, columns=None):
+    for chunk in read_excel_chunks(spec.path, spec.sheet, columns):
+        result = clean(chunk)
+        frame = result[0] if isinstance(result, tuple) else result
+        codes = np.zeros(len(frame), dtype='int8')
+        frame = frame.assign(
+            Site=pd.Categorical.from_codes(codes, [spec.site]),
+            Source=pd.Categorical.from_codes(codes, [spec.source])
+        )
+        yield (frame,) + result[1:] if isinstance(result, tuple) else frame
+
+
+# Tâche d'un processus du pool : la feuille nettoyée entière. Seuls les blocs nettoyés
+# (colonnes typées, catégories) sont gardés en mémoire, jamais la feuille brute.
+def read_workbook(spec, clean, columns=None):
+    results = list(iter_workbook(spec, clean, columns))
+    if isinstance(results[0], tuple):
+        return concat_compact([frame for frame, _ in results]), merge_reports([report for _, report in results])
+    return concat_compact(results)
+
+
+def describe_error(exc):
+    return f"{type(exc).__name__}: {exc}"
+
+
+# Appliquer `task(spec, *args)` aux classeurs en parallèle (un processus par classeur, au
+# plus `workers`). Retourne ({spec.key: résultat}, {spec.key: exception}) : l'échec d'un
+# classeur est rapporté sans bloquer les autres. Avec un seul processus, exécution sur place.
+# Les résultats sont indexés par la clé (chemin absolu et feuille), jamais par le libellé.
+def map_workbooks(task, specs, *args, workers=None):
+    results, errors = {}, {}
+    workers = min(workers or os.cpu_count() or 1, len(specs))
+    if workers <= 1:
+        for spec in specs:
+            try:
+                results[spec.key] = task(spec, *args)
+            except Exception as exc:
+                errors[spec.key] = exc
+        return results, errors
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [(spec, pool.submit(task, spec, *args)) for spec in specs]
+        for spec, future in futures:
+            try:
+                results[spec.key] = future.result()
+            except Exception as exc:
+                errors[spec.key] = exc
+    return results, errors
+
+
+# Lire et nettoyer des classeurs en parallèle ({spec.key: résultat de clean}, {spec.key: exception})
+def read_workbooks(specs, clean, columns=None, workers=None):
+    return map_workbooks(read_workbook, specs, clean, columns, workers=workers)